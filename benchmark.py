@@ -0,0 +1,243 @@
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+
+from impact_analyzer import Worker, KnowledgeBase, Profiler, run_batch, tactics_list_of_choices
+
+impact_choices = ["FULL IMPACT", "PARTIAL IMPACT", "LOW IMPACT", "NO IMPACT"]
+
+# Write a synthetic knowledge base with the same schema as defense_measures.json and scenario_impact_analysis.json
+def generate_knowledge_base(directory, categories, sub_measures, sub_sub_measures, versions, scenarios, techniques, defenses_per_technique, seed):
+    rng = random.Random(seed)
+    k8s_versions = ["1.{}".format(18 + index) for index in range(versions)]
+
+    def measure(measure_id):
+        data = {
+            "id": measure_id,
+            "name": "Synthetic measure {}".format(measure_id),
+            "type": rng.choice(["Prevention", "Detection", "Detection, Prevention"]),
+            "k8s-version-status": {},
+        }
+        for k8s_version in k8s_versions:
+            data["k8s-version-status"][k8s_version] = {
+                "status": "DEPRECATED" if rng.random() < 0.1 else "OK",
+                "info": "https://kubernetes.io/docs/synthetic/{}".format(measure_id),
+            }
+        if rng.random() < 0.5:
+            data["template"] = "https://gist.github.com/synthetic/{}".format(measure_id)
+        return data
+
+    defense_measures = {"DefenseMeasures": []}
+    leaf_ids = []
+    for category in range(1, categories + 1):
+        category_data = {"id": str(category), "name": "Synthetic category {}".format(category), "sub-measures": []}
+        for sub_measure in range(1, sub_measures + 1):
+            sub_measure_data = measure("{}.{}".format(category, sub_measure))
+            if sub_sub_measures:
+                sub_measure_data["sub-measures"] = [measure("{}.{}.{}".format(category, sub_measure, index)) for index in range(1, sub_sub_measures + 1)]
+                leaf_ids.extend(child["id"] for child in sub_measure_data["sub-measures"])
+            leaf_ids.append(sub_measure_data["id"])
+            category_data["sub-measures"].append(sub_measure_data)
+        defense_measures["DefenseMeasures"].append(category_data)
+
+    tactics = tactics_list_of_choices[1:]
+    impact_measures = {"Scenarios": []}
+    for scenario in range(1, scenarios + 1):
+        scenario_data = {"id": str(scenario), "name": "Synthetic scenario {}".format(scenario), "tactics": {tactic: {"techniques": []} for tactic in tactics}}
+        for technique in range(techniques):
+            scenario_data["tactics"][tactics[technique % len(tactics)]]["techniques"].append({
+                "id": "T{}".format(10000 + technique),
+                "name": "Synthetic technique {}".format(technique),
+                "defenses": [{"id": defense_id, "help": "https://gist.github.com/synthetic/help"}
+                             for defense_id in rng.sample(leaf_ids, min(defenses_per_technique, len(leaf_ids)))],
+                "impact": rng.choice(impact_choices),
+            })
+        impact_measures["Scenarios"].append(scenario_data)
+
+    with open(os.path.join(directory, "defense_measures.json"), "w") as f:
+        json.dump(defense_measures, f, indent=4)
+    with open(os.path.join(directory, "scenario_impact_analysis.json"), "w") as f:
+        json.dump(impact_measures, f, indent=4)
+    return k8s_versions
+
+# Point the Worker at the synthetic knowledge base, with a fresh output directory and no report cache
+def configure_worker(directory):
+    Worker.defense_measures_path = os.path.join(directory, "defense_measures.json")
+    Worker.scenario_impact_analysis_path = os.path.join(directory, "scenario_impact_analysis.json")
+    Worker.compiled_kb_path = os.path.join(directory, "knowledge_base.compiled")
+    Worker.output_directory = os.path.join(directory, "output")
+    Worker.asset_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), "assets"))
+    Worker.kb = None
+
+def run_analyzer(output, k8s_version):
+    worker = Worker("analyzer", ["All"], output)
+    worker.use_cache = False
+    worker.echo = False
+    worker.get_scenario_data(0, k8s_version)
+
+# Analyzer run of a fresh process: the compiled knowledge base is loaded before rendering
+def run_cold_analyzer(output, k8s_version):
+    Worker.kb = None
+    run_analyzer(output, k8s_version)
+
+# Batch of the first scenarios in every version
+def run_batch_reports(output, scenarios, k8s_versions, jobs):
+    run_batch(list(range(scenarios)), k8s_versions, [["All"]], [output], jobs, False, False)
+
+# Coverage of a profile deploying every other defense measure
+def run_coverage(k8s_versions):
+    worker = Worker("coverage", ["All"], "stdout")
+    worker.pager = False
+    worker.get_coverage({"deployed": sorted(worker.defense_index)[::2]}, k8s_versions)
+
+def run_optimize(k8s_version, exact_limit):
+    worker = Worker("optimize", ["All"], "stdout")
+    worker.pager = False
+    worker.get_optimized_defenses(list(range(len(worker.impact_measures["Scenarios"]))), k8s_version, {}, exact_limit)
+
+def run_template(output):
+    worker = Worker("template", ["All"], output)
+    worker.use_cache = False
+    worker.echo = False
+    worker.get_only_templates()
+
+def load_json():
+    KnowledgeBase.from_json(Worker.defense_measures_path, Worker.scenario_impact_analysis_path)
+
+def load_compiled():
+    Worker.load_data_from_file()
+
+# Time a case end to end, then once more with the profiler on for per stage time and peak memory
+def measure(case, repeat):
+    timings = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            case()
+            timings.append(time.perf_counter() - start)
+
+        Worker.profiler = Profiler(enabled=True, track_memory=True)
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        case()
+        peak_memory = tracemalloc.get_traced_memory()[1] - current
+        stages = Worker.profiler.stages
+        Worker.profiler = Profiler()
+
+    return {
+        "seconds_min": min(timings),
+        "seconds_median": statistics.median(timings),
+        "peak_memory": peak_memory,
+        "stages": stages,
+    }
+
+def run_benchmarks(args):
+    directory = tempfile.mkdtemp(prefix="impact_analyzer_bench_")
+    try:
+        start = time.perf_counter()
+        k8s_versions = generate_knowledge_base(directory, args.categories, args.sub_measures, args.sub_sub_measures, args.versions,
+                                               args.scenarios, args.techniques, args.defenses_per_technique, args.seed)
+        print("[*] Generated synthetic knowledge base in {:.1f} ms".format((time.perf_counter() - start) * 1000))
+        configure_worker(directory)
+        Worker.compile_knowledge_base()
+
+        cases = {
+            "load:json": load_json,
+            "load:compiled": load_compiled,
+        }
+        for output in ("stdout", "json", "txt", "html"):
+            cases["analyzer:{}".format(output)] = lambda output=output: run_analyzer(output, k8s_versions[-1])
+        cases["analyzer:cold"] = lambda: run_cold_analyzer("json", k8s_versions[-1])
+        for output in ("json", "html"):
+            cases["template:{}".format(output)] = lambda output=output: run_template(output)
+        cases["batch:json"] = lambda: run_batch_reports("json", min(args.batch_scenarios, args.scenarios), k8s_versions, args.jobs)
+        cases["coverage:stdout"] = lambda: run_coverage(k8s_versions)
+        cases["optimize:stdout"] = lambda: run_optimize(k8s_versions[-1], args.exact_limit)
+
+        tracemalloc.start()
+        results = {}
+        for name, case in cases.items():
+            if args.cases and name not in args.cases:
+                continue
+            results[name] = measure(case, args.repeat)
+            print("{:<20}{:>12.2f} ms{:>14.1f} KiB".format(name, results[name]["seconds_median"] * 1000, results[name]["peak_memory"] / 1024))
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        "config": {name: getattr(args, name) for name in ("categories", "sub_measures", "sub_sub_measures", "versions", "scenarios",
+                                                          "techniques", "defenses_per_technique", "seed", "repeat", "batch_scenarios",
+                                                          "jobs", "exact_limit")},
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+
+# Cases whose median time grew by more than the threshold compared to the baseline
+def compare(current, baseline, threshold):
+    if current["config"] != baseline["config"]:
+        print("[!] Baseline was recorded with a different configuration, comparison may be meaningless")
+
+    regressions = []
+    print("{:<20}{:>14}{:>14}{:>10}".format("Case", "Baseline (ms)", "Current (ms)", "Change"))
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["seconds_median"]
+        after = result["seconds_median"]
+        change = after / before - 1 if before else 0
+        print("{:<20}{:>14.2f}{:>14.2f}{:>9.1%}".format(name, before * 1000, after * 1000, change))
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = ArgumentParser(description="Benchmarks for the Kubernetes defense impact analyzer on synthetic knowledge bases")
+    parser.add_argument("--categories", help="Number of defense categories", type=int, default=20)
+    parser.add_argument("--sub-measures", help="Sub-measures per category", type=int, default=50)
+    parser.add_argument("--sub-sub-measures", help="Sub-measures per sub-measure", type=int, default=3)
+    parser.add_argument("--versions", help="Number of Kubernetes versions", type=int, default=4)
+    parser.add_argument("--scenarios", help="Number of scenarios", type=int, default=20)
+    parser.add_argument("--techniques", help="Techniques per scenario", type=int, default=500)
+    parser.add_argument("--defenses-per-technique", help="Defenses per technique", type=int, default=5)
+    parser.add_argument("--seed", help="Random seed", type=int, default=1)
+    parser.add_argument("--repeat", help="Timed runs per case", type=int, default=5)
+    parser.add_argument("--batch-scenarios", help="Scenarios rendered (in every version) by the batch case", type=int, default=2)
+    parser.add_argument("-j", "--jobs", help="Worker processes of the batch case", type=int, default=1)
+    parser.add_argument("--exact-limit", help="Exact search limit of the optimize case", type=int, default=24)
+    parser.add_argument("--cases", help="Only run these cases (e.g. analyzer:html load:compiled)", nargs="+")
+    parser.add_argument("--save", help="Save the results as json to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--threshold", help="Allowed slowdown against the baseline (0.2 = 20%%)", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        parser.error("repeat must be at least 1")
+    if args.jobs < 1 or args.batch_scenarios < 1:
+        parser.error("jobs and batch scenarios must be at least 1")
+
+    current = run_benchmarks(args)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=4)
+        print("[*] Results saved to {}".format(args.save))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print("[!][!] Regressions: {}".format(", ".join(regressions)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
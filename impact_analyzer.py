@@ -1,35 +1,1099 @@
 import json
+import re
+import textwrap
+import shlex
+import shutil
+import subprocess
+import tempfile
+import gzip
+import hashlib
+import pickle
+import mmap
+import time
+import asyncio
+import threading
+import heapq
+import tracemalloc
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from argparse import ArgumentParser,SUPPRESS,HelpFormatter
 import sys
 import os
 from datetime import datetime
-from bs4 import BeautifulSoup
-from termcolor import colored
+from html.parser import HTMLParser
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+tactics_list_of_choices = ["All", "Reconnaissance", "InitialAccess", "Execution", "Discovery", "LateralMovement", "PrivilegeEscalation", "Collection", "DefenseEvasion"]
+output_list_of_choices = ["stdout", "json", "txt", "html"]
+report_separator = "=" * 94
+optimize_criterion = ("a technique is mitigated when at least one of its listed defense measures is in effect "
+                      "(coverage reports it as covered or partially covered)")
+k8s_version_list_of_choices = ["1.18", "1.19", "1.20", "1.21"]
+
+# Per stage wall time, call counts and (optionally) peak memory. When disabled a stage is a shared
+# no-op context manager and counters return immediately, so instrumentation can stay in the hot paths
+class Profiler:
+    disabled_stage = nullcontext()
+
+    def __init__(self, enabled=False, track_memory=False):
+        self.enabled = enabled
+        self.track_memory = enabled and track_memory
+        self.stages = {}
+        self.counters = {}
+        self.frames = []
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        if not self.enabled:
+            return self.disabled_stage
+        return self.measure(name)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Peak memory of nested stages: the parent keeps the highest peak seen before each child resets it
+    @contextmanager
+    def measure(self, name):
+        frame = {"start_memory": 0, "child_peak": 0}
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.frames:
+                self.frames[-1]["child_peak"] = max(self.frames[-1]["child_peak"], peak)
+            frame["start_memory"] = current
+            tracemalloc.reset_peak()
+        self.frames.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.frames.pop()
+            stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_memory": 0})
+            stage["calls"] += 1
+            stage["seconds"] += elapsed
+            if self.track_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                stage["peak_memory"] = max(stage["peak_memory"], peak - frame["start_memory"])
+                if self.frames:
+                    self.frames[-1]["child_peak"] = max(self.frames[-1]["child_peak"], peak)
+
+    # Add the measurements of another profiler (e.g. from a batch worker process)
+    def merge(self, stages, counters):
+        for name, other in stages.items():
+            stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_memory": 0})
+            stage["calls"] += other["calls"]
+            stage["seconds"] += other["seconds"]
+            stage["peak_memory"] = max(stage["peak_memory"], other["peak_memory"])
+        for name, amount in counters.items():
+            self.count(name, amount)
+
+    @staticmethod
+    def max_rss():
+        if resource is None:
+            return 0
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def print_table(self):
+        print("{:<32}{:>8}{:>14}{:>14}{:>16}".format("Stage", "Calls", "Total (ms)", "Mean (ms)", "Peak mem (KiB)"), file=sys.stderr)
+        for name, stage in self.stages.items():
+            peak_memory = "{:.1f}".format(stage["peak_memory"] / 1024) if self.track_memory else "-"
+            print("{:<32}{:>8}{:>14.3f}{:>14.3f}{:>16}".format(name, stage["calls"], stage["seconds"] * 1000, stage["seconds"] * 1000 / stage["calls"], peak_memory), file=sys.stderr)
+        for name, amount in self.counters.items():
+            print("{:<32}{:>8}".format(name, amount), file=sys.stderr)
+        print("Max RSS: {:.1f} MiB".format(self.max_rss() / 1024 / 1024), file=sys.stderr)
+
+    def write_metrics(self, path, metrics_format):
+        if metrics_format == "json":
+            # Memory is only traced with --profile: null rather than a misleading 0 otherwise
+            stages = self.stages if self.track_memory else {name: dict(stage, peak_memory=None) for name, stage in self.stages.items()}
+            with open(path, "w") as f:
+                json.dump({"stages": stages, "counters": self.counters, "max_rss_bytes": self.max_rss()}, f, indent=4)
+            return
+
+        lines = [
+            "# HELP impact_analyzer_stage_seconds_total Wall time spent in each stage.",
+            "# TYPE impact_analyzer_stage_seconds_total counter",
+        ]
+        lines += ['impact_analyzer_stage_seconds_total{{stage="{}"}} {}'.format(name, stage["seconds"]) for name, stage in self.stages.items()]
+        lines += ["# HELP impact_analyzer_stage_calls_total Number of times each stage ran.", "# TYPE impact_analyzer_stage_calls_total counter"]
+        lines += ['impact_analyzer_stage_calls_total{{stage="{}"}} {}'.format(name, stage["calls"]) for name, stage in self.stages.items()]
+        if self.track_memory:
+            lines += ["# HELP impact_analyzer_stage_peak_memory_bytes Peak traced memory allocated by each stage.", "# TYPE impact_analyzer_stage_peak_memory_bytes gauge"]
+            lines += ['impact_analyzer_stage_peak_memory_bytes{{stage="{}"}} {}'.format(name, stage["peak_memory"]) for name, stage in self.stages.items()]
+        lines += ["# HELP impact_analyzer_events_total Hot path event counts.", "# TYPE impact_analyzer_events_total counter"]
+        lines += ['impact_analyzer_events_total{{event="{}"}} {}'.format(name, amount) for name, amount in self.counters.items()]
+        lines += ["# HELP impact_analyzer_max_rss_bytes Peak resident set size of the process.", "# TYPE impact_analyzer_max_rss_bytes gauge"]
+        lines.append("impact_analyzer_max_rss_bytes {}".format(self.max_rss()))
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+# k8s version status entries shared by every measure: versions are columns and each distinct (status, info)
+# pair is stored once. A measure keeps a row of entry ids, one per version (None where it has no entry),
+# and identical rows are shared as well
+class VersionStatusTable:
+    def __init__(self, versions, entries):
+        self.versions = versions
+        self.columns = {k8s_version: column for column, k8s_version in enumerate(versions)}
+        self.entries = entries
+        self.entry_ids = {entry: entry_id for entry_id, entry in enumerate(entries)}
+        self.rows = {}
+        self.dicts = {}
+
+    @classmethod
+    def from_categories(cls, categories):
+        versions = set()
+        entries = {}
+        pending = [measure for category in categories for measure in category["sub-measures"]]
+        while pending:
+            measure = pending.pop()
+            for k8s_version, version_status in measure.get("k8s-version-status", {}).items():
+                versions.add(k8s_version)
+                entries.setdefault((version_status["status"], version_status["info"]), None)
+            pending.extend(measure.get("sub-measures", ()))
+        return cls(sorted(versions, key=lambda k8s_version: tuple(int(part) for part in k8s_version.split(".") if part.isdigit())), list(entries))
+
+    def row(self, k8s_version_status):
+        row = [None] * len(self.versions)
+        for k8s_version, version_status in k8s_version_status.items():
+            row[self.columns[k8s_version]] = self.entry_ids[(version_status["status"], version_status["info"])]
+        row = tuple(row)
+        return self.rows.setdefault(row, row)
+
+    def status(self, row, k8s_version):
+        column = self.columns.get(k8s_version)
+        entry_id = None if column is None else row[column]
+        if entry_id is None:
+            return "OK", ""
+        return self.entries[entry_id]
+
+    # Version map of a row laid out as in the json files, built once per distinct row
+    def as_dict(self, row):
+        version_status = self.dicts.get(row)
+        if version_status is None:
+            version_status = self.dicts[row] = {k8s_version: {"status": self.entries[entry_id][0], "info": self.entries[entry_id][1]}
+                                                for k8s_version, entry_id in zip(self.versions, row) if entry_id is not None}
+        return version_status
+
+    # Copy of a measure subtree with the version maps replaced by rows (compiled records)
+    def compact(self, measure):
+        measure = dict(measure)
+        if "k8s-version-status" in measure:
+            measure["version-status-row"] = self.row(measure.pop("k8s-version-status"))
+        if "sub-measures" in measure:
+            measure["sub-measures"] = [self.compact(sub_measure) for sub_measure in measure["sub-measures"]]
+        return measure
+
+# Resolved defense measure: category, name, type and template looked up once at load time
+class DefenseRecord:
+    __slots__ = ("id", "name", "category", "type", "template", "version_statuses", "version_status_row")
+
+    def __init__(self, measure, category, version_statuses):
+        self.id = measure["id"]
+        self.name = measure["name"]
+        self.category = category
+        self.type = measure.get("type")
+        self.template = measure.get("template")
+        self.version_statuses = version_statuses
+        if "version-status-row" in measure:
+            self.version_status_row = version_statuses.rows.setdefault(measure["version-status-row"], measure["version-status-row"])
+        else:
+            self.version_status_row = version_statuses.row(measure.get("k8s-version-status", {}))
+
+    # Records of measures and their sub-measures, in pre-order
+    @classmethod
+    def walk(cls, measures, category, version_statuses):
+        for measure in measures:
+            yield cls(measure, category, version_statuses)
+            yield from cls.walk(measure.get("sub-measures", ()), category, version_statuses)
+
+    @property
+    def k8s_version_status(self):
+        return self.version_statuses.as_dict(self.version_status_row)
+
+    # Status and info of the measure in the selected k8s version
+    def version_status(self, k8s_version):
+        return self.version_statuses.status(self.version_status_row, k8s_version)
+
+# Escaped, indented html fragments laid out like BeautifulSoup's prettify() (minimal formatter)
+class HtmlStream:
+    def __init__(self, depth=0):
+        self.depth = depth
+        self.fragments = []
+
+    @staticmethod
+    def escape(text):
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    @classmethod
+    def attribute(cls, value):
+        value = cls.escape(value)
+        if '"' not in value:
+            return '"{}"'.format(value)
+        if "'" not in value:
+            return "'{}'".format(value)
+        return '"{}"'.format(value.replace('"', "&quot;"))
+
+    def open(self, tag, **attributes):
+        attributes_string = "".join(" {}={}".format(name, self.attribute(value)) for name, value in attributes.items())
+        self.fragments.append("{}<{}{}>\n".format(" " * self.depth, tag, attributes_string))
+        self.depth += 1
+
+    # Void element (meta, link, br...): self-closing, nothing is nested in it
+    def void(self, tag, **attributes):
+        attributes_string = "".join(" {}={}".format(name, self.attribute(value)) for name, value in attributes.items())
+        self.fragments.append("{}<{}{}/>\n".format(" " * self.depth, tag, attributes_string))
+
+    def close(self, tag):
+        self.depth -= 1
+        self.fragments.append("{}</{}>\n".format(" " * self.depth, tag))
+
+    def text(self, text, raw=False):
+        text = text.strip()
+        if text:
+            self.fragments.append("{}{}\n".format(" " * self.depth, text if raw else self.escape(text)))
+
+    def element(self, tag, text, **attributes):
+        self.open(tag, **attributes)
+        self.text(text)
+        self.close(tag)
+
+    # Return the fragments written so far and release them
+    def drain(self):
+        fragments = "".join(self.fragments)
+        self.fragments = []
+        return fragments
+
+# Html template split around the body content, with the title replaced. Attributes are sorted and void
+# elements self-closed like BeautifulSoup's prettify()
+class HtmlTemplate(HTMLParser):
+    raw_text_tags = ("style", "script")
+    void_tags = ("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr")
+
+    def __init__(self, path, title):
+        super().__init__()
+        self.title = title
+        self.html = HtmlStream()
+        self.tags = []
+        self.head = ""
+        self.body_depth = 0
+
+        with open(path, "r") as f:
+            self.feed(f.read())
+        self.close()
+        self.tail = self.html.drain()
+
+    def handle_starttag(self, tag, attrs):
+        attributes = {name: value or "" for name, value in attrs}
+        attributes = dict(sorted(attributes.items()))
+        if tag in self.void_tags:
+            self.html.void(tag, **attributes)
+            return
+        self.html.open(tag, **attributes)
+        self.tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.tags:
+            return
+        while self.tags:
+            if tag == "body":
+                # Body content of the template stays in front of the generated report
+                self.head = self.html.drain()
+                self.body_depth = self.html.depth
+            open_tag = self.tags.pop()
+            self.html.close(open_tag)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.tags and self.tags[-1] == "title":
+            self.html.text(self.title)
+        else:
+            self.html.text(data, raw=bool(self.tags) and self.tags[-1] in self.raw_text_tags)
+
+    def handle_decl(self, decl):
+        self.html.fragments.append("<!{}>\n".format(decl))
+
+    def handle_comment(self, data):
+        self.html.fragments.append("{}<!--{}-->\n".format(" " * self.html.depth, data))
+
+# Ansi sequences of the colors used by the stdout reports, formatted once instead of per colored line
+ansi_colors = {"red": "\033[31m", "green": "\033[32m", "yellow": "\033[33m", "blue": "\033[34m", "magenta": "\033[35m", "cyan": "\033[36m"}
+ansi_reset = "\033[0m"
+
+# Stdout report collected into large chunks. Colors are only written to a terminal (NO_COLOR and
+# ANSI_COLORS_DISABLED turn them off, FORCE_COLOR on), and a report longer than the terminal is streamed into
+# $PAGER (less by default, with LESS=FRX like git so that colors pass through)
+class TerminalWriter:
+    chunk_size = 1 << 16
+
+    def __init__(self, stream=None, pager=True):
+        self.stream = sys.stdout if stream is None else stream
+        try:
+            tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            tty = False
+
+        if "NO_COLOR" in os.environ or "ANSI_COLORS_DISABLED" in os.environ:
+            self.color = False
+        else:
+            self.color = tty or "FORCE_COLOR" in os.environ
+
+        # Lines left before the report no longer fits the terminal (None: not paging)
+        self.pager_command = shlex.split(os.environ.get("PAGER", "less"))
+        self.lines_left = shutil.get_terminal_size().lines - 1 if pager and tty and self.pager_command and self.pager_command != ["cat"] else None
+        self.pager = None
+        self.broken = False
+        self.chunks = []
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def paint(self, text, color):
+        if not self.color:
+            return text
+        return "{}{}{}".format(ansi_colors[color], text, ansi_reset)
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.lines_left is not None:
+            self.lines_left -= text.count("\n")
+            if self.lines_left < 0:
+                self.lines_left = None
+                self.start_pager()
+        if self.size >= self.chunk_size and self.lines_left is None:
+            self.flush()
+
+    def start_pager(self):
+        env = dict(os.environ)
+        env.setdefault("LESS", "FRX")
+        try:
+            self.pager = subprocess.Popen(self.pager_command, stdin=subprocess.PIPE, env=env, universal_newlines=True)
+        except OSError:
+            self.pager = None
+
+    def flush(self):
+        text = "".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        if self.broken or not text:
+            return
+        try:
+            if self.pager is not None:
+                self.pager.stdin.write(text)
+            else:
+                self.stream.write(text)
+                self.stream.flush()
+        except BrokenPipeError:
+            # Pager quit or reader closed the pipe (e.g. | head): the rest of the report is dropped
+            self.broken = True
+            if self.pager is None:
+                try:
+                    os.dup2(os.open(os.devnull, os.O_WRONLY), self.stream.fileno())
+                except (AttributeError, OSError, ValueError):
+                    pass
+
+    def close(self):
+        self.lines_left = None
+        self.flush()
+        if self.pager is not None:
+            try:
+                self.pager.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.pager.wait()
+            self.pager = None
+
+# Records of a compiled knowledge base (one pickled scenario or defense category each) read from the
+# memory mapped file on first access
+class CompiledRecords(Sequence):
+    def __init__(self, mapping, base, offsets, rebuilt):
+        self.mapping = mapping
+        self.base = base
+        self.offsets = offsets
+        self.rebuilt = rebuilt
+        self.loaded = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[index] for index in range(*position.indices(len(self)))]
+        position = range(len(self.offsets))[position]
+        record = self.loaded.get(position)
+        if record is None:
+            start, end = self.offsets[position]
+            try:
+                record = pickle.loads(self.mapping[self.base + start:self.base + end])
+            except KnowledgeBase.compiled_errors:
+                record = self.rebuilt(position)
+            self.loaded[position] = record
+        return record
+
+# Defense id -> DefenseRecord, resolving a whole defense category the first time one of its ids is looked up
+class DefenseIndex(Mapping):
+    def __init__(self, defense_categories, categories, version_statuses):
+        self.defense_categories = defense_categories
+        self.categories = categories
+        self.version_statuses = version_statuses
+        self.records = {}
+
+    def __getitem__(self, defense_id):
+        record = self.records.get(defense_id)
+        if record is None:
+            category = self.categories[self.defense_categories[defense_id]]
+            self.records.update((record.id, record) for record in DefenseRecord.walk(category["sub-measures"], category["name"], self.version_statuses))
+            record = self.records[defense_id]
+        return record
+
+    def __contains__(self, defense_id):
+        return defense_id in self.defense_categories
+
+    def __iter__(self):
+        return iter(self.defense_categories)
+
+    def __len__(self):
+        return len(self.defense_categories)
+
+# Loaded json data plus a flat index of every defense id (at any depth). A compiled knowledge base is loaded
+# lazily: scenarios and defense categories are separate records of the compiled file, and the derived
+# indexes are grouped in sections that are only read when one of their attributes is first used
+class KnowledgeBase:
+    compiled_format_version = 8
+    compiled_errors = (EOFError, ValueError, TypeError, AttributeError, KeyError, IndexError, ImportError, OverflowError, MemoryError,
+                       pickle.UnpicklingError)
+    core_attributes = ("sources", "digest", "scenario_headers", "defense_categories")
+    sections = {
+        "templates": ("template_entries", "template_owner", "template_order", "tactic_templates"),
+        "incidence": ("defense_children", "deprecated_ids", "technique_rows", "scenario_row_masks", "defense_row_masks",
+                      "tactic_row_masks", "impact_row_masks", "all_row_mask", "undefended_row_mask"),
+        "versions": ("defense_version_rows",),
+    }
+    section_of = {attribute: section for section, attributes in sections.items() for attribute in attributes}
+
+    def __init__(self, defense_measures, impact_measures, sources=None):
+        self.defense_measures = defense_measures
+        self.impact_measures = impact_measures
+        self.sources = sources or {}
+        self.digest = hashlib.sha256("".join(source["sha256"] for source in self.sources.values()).encode()).hexdigest()
+        self.defense_index = {}
+        self.defense_categories = {}
+        self.template_entries = {}
+        self.template_owner = {}
+        self.defense_children = {}
+        self.version_statuses = VersionStatusTable.from_categories(defense_measures["DefenseMeasures"])
+
+        for category_index, defense_category in enumerate(defense_measures["DefenseMeasures"]):
+            self.index_measures(defense_category["sub-measures"], defense_category["name"], category_index, None)
+        self.scenario_headers = [(scenario["id"], scenario["name"]) for scenario in impact_measures["Scenarios"]]
+
+        self.defense_version_rows = {defense_id: record.version_status_row for defense_id, record in self.defense_index.items()}
+        self.deprecated_ids = {k8s_version: frozenset(record.id for record in self.defense_index.values() if record.version_status(k8s_version)[0] == "DEPRECATED")
+                               for k8s_version in self.version_statuses.versions}
+
+        self.template_order = {defense_id: position for position, defense_id in enumerate(self.template_entries)}
+
+        # Inverted index: tactic -> template entries of the defenses used by its techniques
+        self.tactic_templates = {}
+        for scenario in impact_measures["Scenarios"]:
+            for tactic in scenario["tactics"]:
+                owners = self.tactic_templates.setdefault(tactic, set())
+                for technique in scenario["tactics"][tactic]["techniques"]:
+                    for defense in technique["defenses"]:
+                        owner = self.template_owner.get(defense["id"])
+                        if owner is not None:
+                            owners.add(owner)
+
+        # Technique x defense incidence as bitsets: bit i of every mask is the i-th technique row,
+        # a row is (scenario index, tactic, position of the technique in the tactic)
+        self.technique_rows = []
+        self.scenario_row_masks = []
+        defense_rows = {}
+        tactic_rows = {}
+        impact_rows = {}
+        undefended_rows = []
+        for scenario_index, scenario in enumerate(impact_measures["Scenarios"]):
+            first_row = len(self.technique_rows)
+            for tactic in scenario["tactics"]:
+                for position, technique in enumerate(scenario["tactics"][tactic]["techniques"]):
+                    row = len(self.technique_rows)
+                    self.technique_rows.append((scenario_index, tactic, position))
+                    tactic_rows.setdefault(tactic, []).append(row)
+                    impact_rows.setdefault(technique["impact"], []).append(row)
+                    if not technique["defenses"]:
+                        undefended_rows.append(row)
+                    for defense in technique["defenses"]:
+                        defense_rows.setdefault(defense["id"], []).append(row)
+            self.scenario_row_masks.append(((1 << len(self.technique_rows)) - 1) ^ ((1 << first_row) - 1))
+
+        self.all_row_mask = (1 << len(self.technique_rows)) - 1
+        self.undefended_row_mask = self.mask_from_rows(undefended_rows)
+        self.defense_row_masks = {defense_id: self.mask_from_rows(rows) for defense_id, rows in defense_rows.items()}
+        self.tactic_row_masks = {tactic: self.mask_from_rows(rows) for tactic, rows in tactic_rows.items()}
+        self.impact_row_masks = {impact: self.mask_from_rows(rows) for impact, rows in impact_rows.items()}
+
+    # Read the section holding a derived index of a compiled knowledge base on first use
+    def __getattr__(self, name):
+        section = self.section_of.get(name)
+        offsets = self.__dict__.get("section_offsets")
+        if section is None or offsets is None:
+            raise AttributeError(name)
+        start, end = offsets[section]
+        try:
+            self.__dict__.update(pickle.loads(self.mapping[self.record_base + start:self.record_base + end]))
+        except self.compiled_errors:
+            self.__dict__.update({attribute: getattr(self.rebuilt(), attribute) for attribute in self.sections[section]})
+        return self.__dict__[name]
+
+    # A record of the compiled artifact does not unpickle: rebuild the knowledge base from the json files once,
+    # rewrite the artifact and serve the records not read yet from the rebuilt one
+    def rebuilt(self):
+        kb = self.__dict__.get("rebuilt_kb")
+        if kb is None:
+            print("[!] Compiled knowledge base {} is damaged, rebuilding it".format(self.compiled_path), file=sys.stderr)
+            kb = self.rebuilt_kb = KnowledgeBase.from_json(*self.json_paths)
+            try:
+                kb.compile(self.compiled_path)
+            except OSError as e:
+                print("[!] Could not write compiled knowledge base {}: {}".format(self.compiled_path, e), file=sys.stderr)
+        return kb
+
+    @staticmethod
+    def mask_from_rows(rows):
+        if not rows:
+            return 0
+        buffer = bytearray(max(rows) // 8 + 1)
+        for row in rows:
+            buffer[row >> 3] |= 1 << (row & 7)
+        return int.from_bytes(buffer, "little")
+
+    # A measure with a template is the template entry of its whole subtree,
+    # deeper measures only get their own entry when no ancestor has a template
+    def index_measures(self, measures, category, category_index, template_owner):
+        for measure in measures:
+            self.defense_index[measure["id"]] = DefenseRecord(measure, category, self.version_statuses)
+            self.defense_categories[measure["id"]] = category_index
+            owner = template_owner
+            if owner is None and "template" in measure:
+                owner = measure["id"]
+                self.template_entries[owner] = {"defense_name": measure["name"], "template": measure["template"]}
+            self.template_owner[measure["id"]] = owner
+            if "sub-measures" in measure:
+                self.defense_children[measure["id"]] = [sub_measure["id"] for sub_measure in measure["sub-measures"]]
+                self.index_measures(measure["sub-measures"], category, category_index, owner)
+
+    # Deploying a measure deploys its sub-measures, a measure counts as deployed once all of its sub-measures are
+    def expand_deployed(self, defense_ids):
+        deployed = set()
+        pending = list(defense_ids)
+        while pending:
+            defense_id = pending.pop()
+            if defense_id not in deployed:
+                deployed.add(defense_id)
+                pending.extend(self.defense_children.get(defense_id, ()))
+
+        # defense_children is in pre-order, reversed it visits sub-measures before their parent
+        for defense_id in reversed(list(self.defense_children)):
+            if all(child in deployed for child in self.defense_children[defense_id]):
+                deployed.add(defense_id)
+        return deployed
+
+    # Technique rows of the selected scenarios (None for every scenario) and tactics ("All" for every tactic)
+    def selected_rows(self, scenarios, tactics):
+        if scenarios is None:
+            mask = self.all_row_mask
+        else:
+            mask = 0
+            for scenario in scenarios:
+                mask |= self.scenario_row_masks[scenario]
+        if "All" not in tactics:
+            tactics_mask = 0
+            for tactic in tactics:
+                tactics_mask |= self.tactic_row_masks.get(tactic, 0)
+            mask &= tactics_mask
+        return mask
+
+    # Technique rows fully covered (every listed defense deployed) and partially covered in a k8s version.
+    # Measures deprecated in that version do not count as deployed
+    def row_coverage(self, deployed, k8s_version):
+        deprecated = self.deprecated_ids.get(k8s_version, frozenset())
+        touched = 0
+        missing = 0
+        for defense_id, mask in self.defense_row_masks.items():
+            if defense_id in deployed and defense_id not in deprecated:
+                touched |= mask
+            else:
+                missing |= mask
+        full = self.all_row_mask & ~missing & ~self.undefended_row_mask
+        return full, touched & missing
+
+    # Technique rows each measure mitigates in a k8s version: its own rows and the rows of its sub-measures,
+    # measures deprecated in that version mitigate nothing
+    def cover_masks(self, k8s_version):
+        deprecated = self.deprecated_ids.get(k8s_version, frozenset())
+        covers = {}
+        # defense_index is in pre-order, reversed it visits sub-measures before their parent
+        for defense_id in reversed(list(self.defense_index)):
+            if defense_id in deprecated:
+                continue
+            mask = self.defense_row_masks.get(defense_id, 0)
+            for child in self.defense_children.get(defense_id, ()):
+                mask |= covers.get(child, 0)
+            covers[defense_id] = mask
+        return {defense_id: covers[defense_id] for defense_id in self.defense_index if defense_id in covers}
+
+    # Measures whose status or info differs between two k8s versions, in catalog order. Only the version rows
+    # are read, each distinct row is compared once
+    def version_changes(self, from_version, to_version):
+        changed_rows = {}
+        changes = []
+        for defense_id, row in self.defense_version_rows.items():
+            changed = changed_rows.get(row)
+            if changed is None:
+                changed = changed_rows[row] = self.version_statuses.status(row, from_version) != self.version_statuses.status(row, to_version)
+            if changed:
+                changes.append(defense_id)
+        return changes
+
+    # Scenario index, tactic and technique of a technique row
+    def technique(self, row):
+        scenario_index, tactic, position = self.technique_rows[row]
+        return scenario_index, tactic, self.impact_measures["Scenarios"][scenario_index]["tactics"][tactic]["techniques"][position]
+
+    # Template entries for the selected tactics, in catalog order
+    def templates_for(self, tactics):
+        if "All" in tactics:
+            return dict(self.template_entries)
+        selected = set().union(*(self.tactic_templates.get(tactic, ()) for tactic in tactics))
+        return {defense_id: self.template_entries[defense_id] for defense_id in sorted(selected, key=self.template_order.__getitem__)}
+
+    # Parse the json files and build the index
+    @classmethod
+    def from_json(cls, defense_measures_path, scenario_impact_analysis_path):
+        sources = {}
+        data = []
+        for path in (defense_measures_path, scenario_impact_analysis_path):
+            with open(path, "rb") as f:
+                raw = f.read()
+                stat = os.fstat(f.fileno())
+            sources[path] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "sha256": hashlib.sha256(raw).hexdigest()}
+            data.append(json.loads(raw))
+        return cls(data[0], data[1], sources)
+
+    # Check mtime and size first, fall back to the content hash when they differ.
+    # Returns the up to date fingerprints, or None when a source file has changed
+    @staticmethod
+    def check_sources(sources):
+        checked = {}
+        for path, source in sources.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            if stat.st_mtime_ns == source["mtime"] and stat.st_size == source["size"]:
+                checked[path] = source
+                continue
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != source["sha256"]:
+                    return None
+            checked[path] = dict(source, mtime=stat.st_mtime_ns)
+        return checked
+
+    # Plain data only (no instances of this module's classes), so that it unpickles the same whether the
+    # module runs as a script (__main__) or is imported. Every record and section is read in
+    def __getstate__(self):
+        state = {attribute: getattr(self, attribute) for attribute in self.core_attributes + tuple(self.section_of)}
+        state["version_statuses"] = (self.version_statuses.versions, self.version_statuses.entries)
+        state["defense_measures"] = {"DefenseMeasures": list(self.defense_measures["DefenseMeasures"])}
+        state["impact_measures"] = {"Scenarios": list(self.impact_measures["Scenarios"])}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.version_statuses = VersionStatusTable(*state["version_statuses"])
+        self.defense_index = {record.id: record for category in self.defense_measures["DefenseMeasures"]
+                              for record in DefenseRecord.walk(category["sub-measures"], category["name"], self.version_statuses)}
+
+    # Knowledge base over a memory mapped compiled file, only the core attributes are loaded up front
+    @classmethod
+    def from_compiled(cls, core, mapping, record_base):
+        kb = cls.__new__(cls)
+        kb.__dict__.update(core)
+        kb.version_statuses = VersionStatusTable(*core["version_statuses"])
+        kb.mapping = mapping
+        kb.record_base = record_base
+        kb.defense_measures = {"DefenseMeasures": CompiledRecords(mapping, record_base, core["category_offsets"],
+                                                                  lambda position: kb.version_statuses.compact(kb.rebuilt().defense_measures["DefenseMeasures"][position]))}
+        kb.impact_measures = {"Scenarios": CompiledRecords(mapping, record_base, core["scenario_offsets"],
+                                                           lambda position: kb.rebuilt().impact_measures["Scenarios"][position])}
+        kb.defense_index = DefenseIndex(kb.defense_categories, kb.defense_measures["DefenseMeasures"], kb.version_statuses)
+        return kb
+
+    # Write the compiled artifact: a (format version, sources, size of the records) header, the core attributes with the offsets of
+    # every record and section, then the records and sections themselves
+    def compile(self, compiled_path):
+        records = []
+        size = 0
+        def add(record):
+            nonlocal size
+            data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            records.append(data)
+            size += len(data)
+            return size - len(data), size
+
+        core = {attribute: getattr(self, attribute) for attribute in self.core_attributes}
+        core["version_statuses"] = (self.version_statuses.versions, self.version_statuses.entries)
+        core["scenario_offsets"] = [add(scenario) for scenario in self.impact_measures["Scenarios"]]
+        core["category_offsets"] = [add(self.version_statuses.compact(category)) for category in self.defense_measures["DefenseMeasures"]]
+        core["section_offsets"] = {section: add({attribute: getattr(self, attribute) for attribute in attributes})
+                                   for section, attributes in self.sections.items()}
+
+        # Batch processes and concurrent runs may rebuild the artifact at the same time: each writes its own file
+        tmp_path = "{}.{}.tmp".format(compiled_path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.compiled_format_version, self.sources, size), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(core, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.writelines(records)
+        os.replace(tmp_path, compiled_path)
+
+    # Map the compiled artifact, rebuilding it from the json files when missing, stale or truncated
+    @classmethod
+    def load(cls, defense_measures_path, scenario_impact_analysis_path, compiled_path):
+        kb = None
+        try:
+            with open(compiled_path, "rb") as f:
+                format_version, sources, records_size = pickle.load(f)
+                if format_version == cls.compiled_format_version and set(sources) == {defense_measures_path, scenario_impact_analysis_path}:
+                    checked = cls.check_sources(sources)
+                    if checked is not None:
+                        core = pickle.load(f)
+                        if os.fstat(f.fileno()).st_size != f.tell() + records_size:
+                            raise EOFError("truncated compiled knowledge base")
+                        kb = cls.from_compiled(core, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f.tell())
+                        kb.json_paths = (defense_measures_path, scenario_impact_analysis_path)
+                        kb.compiled_path = compiled_path
+                        if checked == sources:
+                            return kb
+                        # Only the mtime changed (touch, checkout): keep the data, refresh the fingerprints
+                        kb.sources = checked
+        except (OSError,) + cls.compiled_errors:
+            pass
+
+        if kb is None:
+            kb = cls.from_json(defense_measures_path, scenario_impact_analysis_path)
+        try:
+            kb.compile(compiled_path)
+        except OSError as e:
+            print("[!] Could not write compiled knowledge base {}: {}".format(compiled_path, e), file=sys.stderr)
+        return kb
+
+# On-disk cache of generated reports keyed on everything that determines their content, one small file per
+# entry so that concurrent processes (batch mode) never rewrite a shared index:
+#   entries/<key>.json    report path, size and creation time (the file mtime is the last use)
+#   names/<name digest>   entry a report or link name belongs to
+#   links/<key>/          links (batch names) to the report of an entry, removed together with it
+#   hits, misses          append-only counters, one byte per lookup
+# Files are replaced atomically, only --clear / --prune take the lock. Cached reports are the user's own files
+# in the output directory: they are only deleted on request (cache --clear / --prune)
+class ReportCache:
+    max_size = 512 * 1024 * 1024
+    max_age = 30 * 24 * 3600
+
+    def __init__(self, directory):
+        self.directory = "{}/.report_cache".format(directory)
+        self.lock_path = "{}/lock".format(self.directory)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return "{}/entries/{}.json".format(self.directory, key)
+
+    def name_path(self, name):
+        return "{}/names/{}".format(self.directory, hashlib.sha256(os.path.abspath(name).encode()).hexdigest())
+
+    def links_directory(self, key):
+        return "{}/links/{}".format(self.directory, key)
+
+    def read(self, path):
+        try:
+            with open(path, "r") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(descriptor, "w") as f:
+            f.write(json.dumps(data))
+        os.replace(temporary, path)
+
+    @staticmethod
+    def unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def count(self, counter):
+        os.makedirs(self.directory, exist_ok=True)
+        with open("{}/{}".format(self.directory, counter), "ab") as f:
+            f.write(b".")
+
+    def stats(self):
+        counts = []
+        for counter in ("hits", "misses"):
+            try:
+                counts.append(os.path.getsize("{}/{}".format(self.directory, counter)))
+            except OSError:
+                counts.append(0)
+        return counts
+
+    # Path of the cached report, None on a miss
+    def lookup(self, key):
+        entry = self.read(self.entry_path(key))
+        if entry is not None and os.path.exists(entry["path"]):
+            os.utime(self.entry_path(key))
+            self.count("hits")
+            return entry["path"]
+
+        if entry is not None:
+            self.remove(key)
+        self.count("misses")
+        return None
+
+    def store(self, key, path):
+        self.write(self.entry_path(key), {"path": path, "size": os.path.getsize(path), "created": time.time()})
+        self.write(self.name_path(path), {"key": key, "link": False})
+
+    # A report file is about to be replaced: forget the entry it holds (and its links, which would now show the
+    # new content) or the link it was. Names that hold nothing cost a failed open
+    def release(self, path):
+        name = self.read(self.name_path(path))
+        if name is None:
+            return
+        if name["link"]:
+            self.unlink("{}/{}".format(self.links_directory(name["key"]), os.path.basename(self.name_path(path))))
+            self.unlink(self.name_path(path))
+        else:
+            self.remove(name["key"], keep=path)
+
+    # Record a symlink to a cached report so that it is removed together with the report
+    def add_link(self, key, link_path):
+        os.makedirs(self.links_directory(key), exist_ok=True)
+        with open("{}/{}".format(self.links_directory(key), os.path.basename(self.name_path(link_path))), "w") as f:
+            f.write(link_path)
+        self.write(self.name_path(link_path), {"key": key, "link": True})
+
+    # Remove an entry with its report and links (the report file named keep is left in place)
+    def remove(self, key, keep=None):
+        entry = self.read(self.entry_path(key))
+        links_directory = self.links_directory(key)
+        try:
+            link_names = os.listdir(links_directory)
+        except OSError:
+            link_names = []
+        for link_name in link_names:
+            try:
+                with open("{}/{}".format(links_directory, link_name), "r") as f:
+                    link = f.read()
+            except OSError:
+                continue
+            if os.path.islink(link) and (keep is None or os.path.abspath(link) != os.path.abspath(keep)):
+                self.unlink(link)
+            self.unlink(self.name_path(link))
+            self.unlink("{}/{}".format(links_directory, link_name))
+        try:
+            os.rmdir(links_directory)
+        except OSError:
+            pass
+        if entry is not None:
+            if keep is None:
+                self.unlink(entry["path"])
+            self.unlink(self.name_path(entry["path"]))
+        self.unlink(self.entry_path(key))
+
+    def entries(self):
+        entries = {}
+        try:
+            names = os.listdir("{}/entries".format(self.directory))
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            entry = self.read(self.entry_path(key))
+            if entry is not None:
+                try:
+                    entry["last_used"] = os.path.getmtime(self.entry_path(key))
+                except OSError:
+                    continue
+                entries[key] = entry
+        return entries
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    # Drop entries older than max_age, then the least recently used ones until the cache fits in max_size
+    def prune(self):
+        with self.locked():
+            entries = self.entries()
+            now = time.time()
+            expired = [key for key, entry in entries.items() if now - entry["created"] > self.max_age]
+            total_size = sum(entry["size"] for entry in entries.values())
+            for key in sorted(entries, key=lambda key: entries[key]["last_used"]):
+                if key not in expired and total_size <= self.max_size:
+                    break
+                if key not in expired:
+                    expired.append(key)
+                total_size -= entries[key]["size"]
+            for key in expired:
+                self.remove(key)
+
+    def clear(self):
+        with self.locked():
+            for key in self.entries():
+                self.remove(key)
+            for counter in ("hits", "misses"):
+                self.unlink("{}/{}".format(self.directory, counter))
+
+    def print_stats(self):
+        entries = self.entries()
+        hits, misses = self.stats()
+        lookups = hits + misses
+        print("Entries: {}".format(len(entries)))
+        print("Size: {} bytes".format(sum(entry["size"] for entry in entries.values())))
+        print("Hits: {}".format(hits))
+        print("Misses: {}".format(misses))
+        print("Hit ratio: {:.1%}".format(hits / lookups if lookups else 0))
+
+# Immutable report model resolved once per analysis and consumed by every renderer
+Report = namedtuple("Report", ["id", "name", "k8s_version", "selected_tactics", "tactics"])
+ReportTactic = namedtuple("ReportTactic", ["name", "techniques", "source"])
+ReportTechnique = namedtuple("ReportTechnique", ["id", "name", "impact", "defenses", "source"])
+ReportDefense = namedtuple("ReportDefense", ["id", "name", "category", "type", "template", "status", "info", "version_status_row", "source"])
+
+# Version delta: measures whose status or info changes between two k8s versions and the techniques listing them,
+# with the number of their defenses in effect (not deprecated) in each version
+VersionDelta = namedtuple("VersionDelta", ["from_version", "to_version", "selected_tactics", "measures", "scenarios"])
+DeltaMeasure = namedtuple("DeltaMeasure", ["id", "name", "category", "from_status", "from_info", "to_status", "to_info", "techniques"])
+DeltaScenario = namedtuple("DeltaScenario", ["id", "name", "techniques"])
+DeltaTechnique = namedtuple("DeltaTechnique", ["tactic", "id", "name", "impact", "defenses", "from_effective", "to_effective", "changed"])
 
 class Worker:
     defense_measures_path = "./defense_measures.json"
     scenario_impact_analysis_path = "./scenario_impact_analysis.json"
+    compiled_kb_path = "./knowledge_base.compiled"
     output_directory = "./output"
     asset_directory = "./assets"
     html_template = "analyzer_output_template.html"
 
+    kb = None
+    profiler = Profiler()
+
     def __init__(self, mode, tactics, output):
-        self.load_data_from_file()
+        if Worker.kb is None:
+            self.load_data_from_file()
         self.mode = mode
         self.tactics = tactics
-        self.output = output
+        # Repeated formats (-o json json) are written once
+        self.outputs = [output] if isinstance(output, str) else list(dict.fromkeys(output))
+        self.output = self.outputs[0]
+        self.output_filename = None
+        self.echo = True
+        self.use_cache = True
+        self.compact = False
+        self.pager = True
+        self.scenario = None
     
-    # Load data from json files
+    # Load data from the compiled knowledge base (rebuilt from the json files when stale)
     @classmethod
     def load_data_from_file(cls):
-        with open(cls.defense_measures_path, "r") as f:
-            cls.defense_measures = json.load(f)
-        
-        with open(cls.scenario_impact_analysis_path, "r") as f:
-            cls.impact_measures = json.load(f)
+        with cls.profiler.stage("load_data_from_file"):
+            cls.set_knowledge_base(KnowledgeBase.load(cls.defense_measures_path, cls.scenario_impact_analysis_path, cls.compiled_kb_path))
+
+    @classmethod
+    def set_knowledge_base(cls, kb):
+        Worker.kb = kb
+        Worker.defense_measures = kb.defense_measures
+        Worker.impact_measures = kb.impact_measures
+        Worker.defense_index = kb.defense_index
+
+    # Force a rebuild of the compiled knowledge base
+    @classmethod
+    def compile_knowledge_base(cls):
+        start = time.perf_counter()
+        kb = KnowledgeBase.from_json(cls.defense_measures_path, cls.scenario_impact_analysis_path)
+        kb.compile(cls.compiled_kb_path)
+        cls.set_knowledge_base(kb)
+        print("[*] Compiled {} defense measures into {} ({} bytes) in {:.1f} ms".format(
+            len(kb.defense_index), cls.compiled_kb_path, os.path.getsize(cls.compiled_kb_path), (time.perf_counter() - start) * 1000))
 
     # Get scenario data with selected tactics from storage
     def get_scenario_data(self, scenario, k8s_version):
+        self.scenario = scenario
+        with self.profiler.stage("select_scenario_data"):
+            self.select_scenario_data(scenario)
+        with self.profiler.stage("build_report"):
+            report = self.build_report(k8s_version)
+
+        # Output: stdout first, then every requested file written concurrently from the same report
+        # (sequentially when profiling, so that each renderer is measured on its own)
+        if "stdout" in self.outputs:
+            with self.profiler.stage("output:stdout"):
+                self.analyze_output_stdout(report)
+
+        writers = {
+            "json": self.analyze_output_json,
+            "txt": self.analyze_output_txt,
+            "html": lambda report: self.output_html(report, "analyzer"),
+            "html-site": self.output_html_site,
+        }
+        file_outputs = [output for output in self.outputs if output != "stdout"]
+        if len(file_outputs) == 1 or self.profiler.enabled:
+            for output in file_outputs:
+                writers[output](report)
+        elif file_outputs:
+            with ThreadPoolExecutor(max_workers=len(file_outputs)) as executor:
+                for future in [executor.submit(writers[output], report) for output in file_outputs]:
+                    future.result()
+
+    # Keep only the selected tactics of the scenario
+    def select_scenario_data(self, scenario):
         self.result = {
             "id": self.impact_measures["Scenarios"][scenario]["id"],
             "name": self.impact_measures["Scenarios"][scenario]["name"],
@@ -42,381 +1106,1633 @@ class Worker:
             for tactic in self.tactics:
                 if tactic in self.impact_measures["Scenarios"][scenario]["tactics"]:
                     self.result["tactics"][tactic] = self.impact_measures["Scenarios"][scenario]["tactics"][tactic]
-        
-        # Output
-        if self.output == "json":
-            self.analyze_output_json(k8s_version)
-        elif self.output == "stdout":
-            self.analyze_output_stdout(k8s_version)
-        elif self.output == "txt":
-            self.analyze_output_txt(k8s_version)
-        else:
-            self.output_html(k8s_version, "analyzer")
-        
-    # Get details from defense ids
-    def get_defense_details(self, defense_id, k8s_version):
-        details = {}
-        defense_id_split_list = defense_id.split(".")
-        root_category_defense_id = int(defense_id_split_list[0])-1
-        defense_category = self.defense_measures["DefenseMeasures"][root_category_defense_id]
-        details["category"] = defense_category["name"]
-
-        level = len(defense_id_split_list)
-        full_defense_data = {}
-        if level == 3:
-            full_defense_data = self.defense_measures["DefenseMeasures"][root_category_defense_id]["sub-measures"][int(defense_id_split_list[1])-1]["sub-measures"][int(defense_id_split_list[2])-1]
-        else:
-            full_defense_data = self.defense_measures["DefenseMeasures"][root_category_defense_id]["sub-measures"][int(defense_id_split_list[1])-1]
-        
-        details["id"] = full_defense_data["id"]
-        details["name"] = full_defense_data["name"]
-        details["type"] = full_defense_data["type"]
-
-        if "template" in full_defense_data:
-            details["template"] = full_defense_data["template"]
-
-        if "k8s-version-status" in full_defense_data:
-            details["k8s-version-status"] = full_defense_data["k8s-version-status"]
-        
-        return details
-
-    # Write output to stdout
-    def analyze_output_stdout(self, k8s_version):
-        print("==============================================================================================")
-        print("Defense measures for {}".format(self.result["name"]))
-        print("")
 
+    # Resolve every defense of the selected tactics once into an immutable report shared by all renderers
+    def build_report(self, k8s_version):
+        tactics = []
+        lookups = 0
         for key in self.result["tactics"]:
-            print(colored("#{}".format(key), "cyan"))
+            techniques = []
             for technique in self.result["tactics"][key]["techniques"]:
-                print(" {}-{}".format(technique["id"], technique["name"]) )
-                print("     Enabled defense measures")
+                defenses = []
                 for defense in technique["defenses"]:
-                    details = self.get_defense_details(defense["id"], k8s_version)
-                    print("         Category: {}".format(details["category"]))
-                    print("         Measure: {} {}".format(defense["id"],details["name"]))
-                    print("         Type: {}".format(details["type"]))
-                    if details["k8s-version-status"][k8s_version]["status"] == "DEPRECATED":
-                        print("         Measure is deprecated in version {}".format(k8s_version))  
-                    print("         For more information visit {}".format(details["k8s-version-status"][k8s_version]["info"]))
-                    if "template" in details:
-                        print("         Template: {}".format(details["template"]))
-
-                impact = ""
-                if technique["impact"] == "FULL IMPACT":
-                    impact = colored(technique["impact"], "red")
-                elif technique["impact"] == "PARTIAL IMPACT":
-                    impact = colored(technique["impact"], "magenta")
-                elif technique["impact"] == "LOW IMPACT":
-                    impact = colored(technique["impact"], "yellow")
-                else:
-                    impact = colored(technique["impact"], "blue")
-
-                print("     Impact of defensive measures: {}".format(impact))
-            print("")
-
-        print("==============================================================================================")
-    
-    # Generate json output
-    def analyze_output_json(self, k8s_version):
+                    details = self.get_defense_details(defense["id"])
+                    status, info = details.version_status(k8s_version)
+                    defenses.append(ReportDefense(defense["id"], details.name, details.category, details.type, details.template,
+                                                  status, info, details.version_status_row, defense))
+                lookups += len(defenses)
+                techniques.append(ReportTechnique(technique["id"], technique["name"], technique["impact"], tuple(defenses), technique))
+            tactics.append(ReportTactic(key, tuple(techniques), self.result["tactics"][key]))
+        self.profiler.count("get_defense_details", lookups)
+        return Report(self.result["id"], self.result["name"], k8s_version, tuple(self.tactics), tuple(tactics))
+
+    # Output file name: timestamped unless a fixed name was requested (batch mode)
+    def get_output_filename(self, file_intro_name, extension):
+        if self.output_filename is not None:
+            return "{}/{}.{}".format(self.output_directory, self.output_filename, extension)
+        return "{}/{}-{}.{}".format(self.output_directory, file_intro_name, datetime.now(), extension)
+
+    # Digest of the html template, recomputed only when the file changes
+    @classmethod
+    def template_digest(cls):
+        path = "{}/{}".format(cls.asset_directory, cls.html_template)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return ""
+        if getattr(cls, "template_fingerprint", (None, ""))[0] != mtime:
+            with open(path, "rb") as f:
+                cls.template_fingerprint = (mtime, hashlib.sha256(f.read()).hexdigest())
+        return cls.template_fingerprint[1]
+
+    # Name to write a file through before replacing it, unique to the process and thread (batch processes and
+    # the concurrent writers of one report may write next to the same name)
+    @staticmethod
+    def temporary_path(path):
+        return "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+
+    # Write a report file, or reuse the identical report from the cache. Returns the report path
+    def write_output(self, file_intro_name, extension, cache_parts, render):
         if not os.path.exists(self.output_directory):
             os.makedirs(self.output_directory)
 
-        dump = self.result
+        filename = self.get_output_filename(file_intro_name, extension)
+        cache = ReportCache(self.output_directory)
+        if self.use_cache:
+            key = ReportCache.key(self.mode, extension, self.kb.digest, self.template_digest(), *cache_parts)
+            cached = cache.lookup(key)
+            if cached is not None:
+                if self.output_filename is not None and os.path.abspath(cached) != os.path.abspath(filename):
+                    cache.release(filename)
+                    link = self.temporary_path(filename)
+                    os.symlink(os.path.relpath(cached, self.output_directory), link)
+                    os.replace(link, filename)
+                    cache.add_link(key, filename)
+                print("[*] Report unchanged, reusing {} (cache hits {}, misses {})".format(cached, *cache.stats()), file=sys.stderr)
+                return cached
+
+        # A fixed name may be a link to another cached report (never written through) or the file of an entry
+        # whose content it no longer holds: render next to it and replace it
+        cache.release(filename)
+        temporary = self.temporary_path(filename)
+        with self.profiler.stage("output:{}".format(extension)), open(temporary, "w") as f:
+            for fragment in render():
+                f.write(fragment)
+        os.replace(temporary, filename)
+        self.profiler.count("bytes_written:{}".format(extension), os.path.getsize(filename))
+        if self.use_cache:
+            cache.store(key, filename)
+        return filename
 
-        for tactic in dump["tactics"]:
-            for technique in dump["tactics"][tactic]["techniques"]:
-                for defense in technique["defenses"]:
-                    details = self.get_defense_details(defense["id"], k8s_version)
-                    defense["name"] = details["name"]
-                    defense["category"] = details["category"]
-                    defense["type"] = details["type"]
-                    defense["k8s-version-status"] = details["k8s-version-status"]
-                    defense["template"] = details["template"]
-
-        filename = "{}/Analyzer-Output-{}.json".format(self.output_directory,datetime.now())
-        with open(filename, "w") as f:
-            json.dump(dump,f,indent=4)
-        print(json.dumps(self.result, indent=4))
-
-    # Generate txt output
-    def analyze_output_txt(self, k8s_version):
-        if not os.path.exists(self.output_directory):
-            os.makedirs(self.output_directory)
-
-        filename = "{}/Analyzer-Output-{}.txt".format(self.output_directory, datetime.now())
-        with open(filename, "w") as f:
-            f.write("Defense measures for {}\n".format(self.result["name"]))
-            f.write("\n")
-
-            for key in self.result["tactics"]:
-                f.write("#{}\n".format(key))
-                f.write(" Attack Techniques\n")
-                for technique in self.result["tactics"][key]["techniques"]:
-                    f.write(" {}-{}\n".format(technique["id"], technique["name"]) )
-                    f.write("     Enabled defense measures\n")
-                    for defense in technique["defenses"]:
+    # Get details from defense ids
+    def get_defense_details(self, defense_id):
+        return self.defense_index[defense_id]
 
-                        details = self.get_defense_details(defense["id"], k8s_version)
-                        f.write("         Category: {}\n".format(details["category"]))
-                        f.write("         Measure: {} {}\n".format(defense["id"],details["name"]))
-                        f.write("         Type: {}\n".format(details["type"]))
-
-                        if details["k8s-version-status"][k8s_version]["status"] == "DEPRECATED":
-                            f.write("         Measure is deprecated in version {}\n".format(k8s_version))
-                            
-                        f.write("         For more information visit {}\n".format(details["k8s-version-status"][k8s_version]["info"]))
-                        if "template" in details:
-                            f.write("         Template: {}\n".format(details["template"]))
-                    f.write("     Impact of defensive measures: {}\n".format(technique["impact"]))
-                f.write("\n")
+    # Write output to stdout
+    def analyze_output_stdout(self, report):
+        with self.terminal() as terminal:
+            impacts = {impact: terminal.paint(impact, color) for impact, color in
+                       (("FULL IMPACT", "red"), ("PARTIAL IMPACT", "magenta"), ("LOW IMPACT", "yellow"))}
+            blocks = {}
+            terminal.write("{}\nDefense measures for {}\n\n".format(report_separator, report.name))
+
+            for tactic in report.tactics:
+                terminal.write(terminal.paint("#{}".format(tactic.name), "cyan") + "\n")
+                for technique in tactic.techniques:
+                    lines = [" {}-{}\n     Enabled defense measures\n".format(technique.id, technique.name)]
+                    for defense in technique.defenses:
+                        lines.append(self.text_defense_block(blocks, defense, report.k8s_version))
+                    impact = impacts.get(technique.impact) or terminal.paint(technique.impact, "blue")
+                    lines.append("     Impact of defensive measures: {}\n".format(impact))
+                    terminal.write("".join(lines))
+                terminal.write("\n")
+
+            terminal.write(report_separator + "\n")
+
+    # Stdout writer of the reports (--no-pager turns the pager off)
+    def terminal(self):
+        return TerminalWriter(pager=self.pager)
+
+    # Lines of a defense measure in the stdout and txt reports, formatted once per report (measures are
+    # listed by many techniques)
+    @staticmethod
+    def text_defense_block(blocks, defense, k8s_version):
+        block = blocks.get(defense.id)
+        if block is None:
+            lines = ["         Category: {}\n         Measure: {} {}\n         Type: {}\n".format(defense.category, defense.id, defense.name, defense.type)]
+            if defense.status == "DEPRECATED":
+                lines.append("         Measure is deprecated in version {}\n".format(k8s_version))
+            lines.append("         For more information visit {}\n".format(defense.info))
+            if defense.template is not None:
+                lines.append("         Template: {}\n".format(defense.template))
+            block = blocks[defense.id] = "".join(lines)
+        return block
     
-    # Generate html output
-    def output_html(self, k8s_version, mode):
+    # Generate json output
+    def analyze_output_json(self, report):
+        filename = self.write_output("Analyzer-Output", "json", (report.id, report.selected_tactics, report.k8s_version, self.compact), lambda: [self.render_json(report)])
+        if self.echo:
+            with open(filename, "r") as f:
+                print(f.read())
+
+    # Compact json lists the version status entries once and every defense references them by index,
+    # one per version in k8s-versions (null where the measure has no entry)
+    def render_json(self, report):
+        version_statuses = self.kb.version_statuses
+        if self.compact:
+            entries = {}
+            rows = {}
+            def version_status(row):
+                if row not in rows:
+                    rows[row] = [None if entry_id is None else entries.setdefault(entry_id, len(entries)) for entry_id in row]
+                return rows[row]
+        else:
+            version_status = version_statuses.as_dict
+
+        # Resolved copies, the scenario data is shared with the knowledge base
+        dump = {"id": report.id, "name": report.name, "tactics": {}}
+
+        for tactic in report.tactics:
+            techniques = []
+            for technique in tactic.techniques:
+                defenses = []
+                for defense in technique.defenses:
+                    defense_dump = dict(defense.source)
+                    defense_dump["name"] = defense.name
+                    defense_dump["category"] = defense.category
+                    defense_dump["type"] = defense.type
+                    defense_dump["k8s-version-status"] = version_status(defense.version_status_row)
+                    if defense.template is not None:
+                        defense_dump["template"] = defense.template
+                    defenses.append(defense_dump)
+                techniques.append(dict(technique.source, defenses=defenses))
+            dump["tactics"][tactic.name] = dict(tactic.source, techniques=techniques)
+
+        if self.compact:
+            dump["k8s-versions"] = version_statuses.versions
+            dump["version-statuses"] = [{"status": version_statuses.entries[entry_id][0], "info": version_statuses.entries[entry_id][1]} for entry_id in entries]
+        return json.dumps(dump, indent=4)
+
+    # Generate txt output
+    def analyze_output_txt(self, report):
+        self.write_output("Analyzer-Output", "txt", (report.id, report.selected_tactics, report.k8s_version), lambda: self.render_txt(report))
+
+    # Txt report, written in chunks of about TerminalWriter.chunk_size characters
+    def render_txt(self, report):
+        blocks = {}
+        lines = ["Defense measures for {}\n\n".format(report.name)]
+        size = 0
+
+        for tactic in report.tactics:
+            lines.append("#{}\n Attack Techniques\n".format(tactic.name))
+            for technique in tactic.techniques:
+                lines.append(" {}-{}\n     Enabled defense measures\n".format(technique.id, technique.name))
+                for defense in technique.defenses:
+                    block = self.text_defense_block(blocks, defense, report.k8s_version)
+                    lines.append(block)
+                    size += len(block)
+                lines.append("     Impact of defensive measures: {}\n".format(technique.impact))
+                if size >= TerminalWriter.chunk_size:
+                    yield "".join(lines)
+                    lines = []
+                    size = 0
+            lines.append("\n")
+        yield "".join(lines)
+
+    # Generate html output (report is None in template mode)
+    def output_html(self, report, mode):
         if not os.path.exists(self.asset_directory):
             print("[!][!] Directory {} does not exist".format(self.asset_directory))
             sys.exit(2)
         
-        if not os.path.exists(self.output_directory):
-            os.makedirs(self.output_directory)
-
-        with open("{}/{}".format(self.asset_directory, self.html_template), "r") as f:
-            self.soup = BeautifulSoup(f, "html.parser")
+        if mode == "template":
+            self.write_output("Template-Output", "html", (self.tactics,), lambda: self.render_html(report, mode))
+        else:
+            self.write_output("Analyzer-Output", "html", (report.id, report.selected_tactics, report.k8s_version), lambda: self.render_html(report, mode))
 
+    # Html report: template head, one fragment per technique, template tail
+    def render_html(self, report, mode):
         generation_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
 
         if mode == "template":
             title_string = "Getting started templates for Kubernetes defensive measures"
         else:
-            title_string = "Kubernetes defense report generated on {} - Version {}".format(generation_time, k8s_version)
+            title_string = "Kubernetes defense report generated on {} - Version {}".format(generation_time, report.k8s_version)
 
-        report_title_h1 = self.soup.new_tag("h1")
-        report_title_h1.string = title_string
-        
-        self.soup.head.title.string = "Output {}".format(generation_time)
-        
+        template = HtmlTemplate("{}/{}".format(self.asset_directory, self.html_template), "Output {}".format(generation_time))
+        html = HtmlStream(template.body_depth)
+
+        yield template.head
         if mode == "template":
-            self.soup.body.append(self.soup_build_get_started_template(report_title_h1))
-            file_intro_name = "Template-Output"
+            yield from self.html_build_get_started_template(html, title_string)
         else:
-            self.soup.body.append(self.soup_build_impact(report_title_h1, k8s_version))
-            file_intro_name = "Analyzer-Output"
-
-
-        filename = "{}/{}-{}.html".format(self.output_directory, file_intro_name, datetime.now())
-        with open(filename, "w") as f:
-            f.write(self.soup.prettify())
+            yield from self.html_build_impact(html, title_string, report)
+        yield template.tail
+
+    # Table of the defense measures of a technique
+    def html_build_defense_table(self, html, technique, k8s_version):
+        # Create table with header rows
+        html.open("table", id="table-{}".format(technique.id))
+        html.open("tr")
+        for header in ("Id", "Measure", "Category", "Type", "Version Compatibility", "Info", "Template"):
+            html.element("th", header)
+        html.close("tr")
+
+        # Set defense measures in table
+        for defense in technique.defenses:
+            html.open("tr")
+            html.element("td", defense.id)
+            html.element("td", defense.name)
+            html.element("td", defense.category)
+            html.element("td", "{}".format(defense.type))
+
+            # Compatibility field: shows status in selected k8s version
+            if defense.status == "DEPRECATED":
+                html.element("td", "Deprecated in version {}".format(k8s_version))
+            else:
+                html.element("td", "OK")
+
+            # Info and Template fields: additional resources to help with setup
+            html.open("td")
+            html.element("a", defense.info, href=defense.info)
+            html.close("td")
+
+            html.open("td")
+            if defense.template is not None:
+                html.element("a", defense.template, href=defense.template)
+            html.close("td")
+            html.close("tr")
+
+        html.close("table")
+
+    # Score of a technique, colored by its impact
+    @staticmethod
+    def html_impact_score(html, impact):
+        if impact == "LOW IMPACT":
+            html.element("span", "Score: {}".format(impact), **{"class": "low"})
+        elif impact == "PARTIAL IMPACT":
+            html.element("span", "Score: {}".format(impact), **{"class": "partial"})
+        else:
+            html.element("span", "Score: {}".format(impact), **{"class": "full"})
 
-    # Build html file for analyzer mode (defensive impact)
-    def soup_build_impact(self, report_title_h1, k8s_version):
-        container_div = self.soup.new_tag("div", id="container")
-        
-        container_div.append(report_title_h1)
+    # Build html file for analyzer mode (defensive impact), one fragment per technique
+    def html_build_impact(self, html, title_string, report):
+        html.open("div", id="container")
+        html.element("h1", title_string)
 
-        for key in self.result["tactics"]:
+        for tactic in report.tactics:
 
             # Create div for tactic
-            tactic_div = self.soup.new_tag("div", id="{}".format("sub-container"))
-            tactic_h2 = self.soup.new_tag("h2")
-            tactic_h2.string = "{}".format(key)
-            tactic_div.append(tactic_h2)
+            html.open("div", id="sub-container")
+            html.element("h2", tactic.name)
 
-            for technique in self.result["tactics"][key]["techniques"]:
+            for technique in tactic.techniques:
                 # Create div for technique
-                technique_div = self.soup.new_tag("div", id="{}".format(technique["id"]), **{'class': 'techniqueDiv'})
-                technique_name_h3 = self.soup.new_tag("h3")
-                technique_name_h3.string = "{}-{}".format(technique["id"], technique["name"])
-                technique_div.append(technique_name_h3) 
-
-                impact_p = self.soup.new_tag("p")
-                if technique["impact"] == "LOW IMPACT":
-                    impact_span = self.soup.new_tag("span", **{'class': 'low'} )
-                elif technique["impact"] == "PARTIAL IMPACT":
-                    impact_span = self.soup.new_tag("span", **{'class': 'partial'} )
-                else:
-                    impact_span = self.soup.new_tag("span", **{'class': 'full'} )
-
-                impact_span.string = "Score: {}".format(technique["impact"])
-                impact_p.append(impact_span)
-                
-                technique_div.append(impact_p)
-
-                # Create table with header rows
-                table = self.soup.new_tag("table", id="table-{}".format(technique["id"]))
-                header_row = self.soup.new_tag("tr")
-
-                header1 = self.soup.new_tag("th")
-                header1.string = "Id"
-                header_row.append(header1)
-
-                header2 = self.soup.new_tag("th")
-                header2.string = "Measure"
-                header_row.append(header2)
-
-                header3 = self.soup.new_tag("th")
-                header3.string = "Category"
-                header_row.append(header3)
+                html.open("div", **{"class": "techniqueDiv", "id": technique.id})
+                html.element("h3", "{}-{}".format(technique.id, technique.name))
 
-                header4 = self.soup.new_tag("th")
-                header4.string = "Type"
-                header_row.append(header4)
+                html.open("p")
+                self.html_impact_score(html, technique.impact)
+                html.close("p")
 
-                header5 = self.soup.new_tag("th")
-                header5.string = "Version Compatibility"
-                header_row.append(header5)
+                self.html_build_defense_table(html, technique, report.k8s_version)
+                html.close("div")
+                yield html.drain()
 
-                header6 = self.soup.new_tag("th")
-                header6.string = "Info"
-                header_row.append(header6)
+            html.close("div")
 
-                header7 = self.soup.new_tag("th")
-                header7.string = "Template"
-                header_row.append(header7)
+        html.close("div")
+        yield html.drain()
 
-                #header8 = soup.new_tag("th")
-                #header8.string = "Help"
-                #header_row.append(header8)
-
-                table.append(header_row)
+    # Html site: an index page linking one page per tactic, whose technique tables are loaded on demand from
+    # one script chunk per technique (script tags also load from file:// where fetch() is refused). The stylesheet
+    # of the template and the loader are shared by every site of the output directory. Only the pages whose
+    # content changed since the previous render are rewritten (batch renders sites in parallel, one per process)
+    def output_html_site(self, report):
+        if not os.path.exists(self.asset_directory):
+            print("[!][!] Directory {} does not exist".format(self.asset_directory))
+            sys.exit(2)
 
-                # Set defense measures in table
-                for defense in technique["defenses"]:
-                    # Get details from defense id
-                    details = self.get_defense_details(defense["id"], k8s_version)
-                    row = self.soup.new_tag("tr")
-
-                    # Id field
-                    data_id = self.soup.new_tag("td")
-                    data_id.string = "{}".format(defense["id"])
-                    row.append(data_id)
-
-                    # Name field
-                    measure = self.soup.new_tag("td")
-                    measure.string = "{}".format(details["name"])
-                    row.append(measure)
-
-                    # Category field
-                    category = self.soup.new_tag("td")
-                    category.string = "{}".format(details["category"])
-                    row.append(category)
-
-                    # Type field
-                    defense_type = self.soup.new_tag("td")
-                    defense_type.string = "{}".format(details["type"])
-                    row.append(defense_type)
-
-                    # Compatibility field: shows status in selected k8s version
-                    compatibility = self.soup.new_tag("td")
-
-                    # Info and Help fields: additional resources to help with setup
-                    info_td = self.soup.new_tag("td")
-                    #help_td = soup.new_tag("td")
-                    template_td = self.soup.new_tag("td")
-                    
-                    info_a = self.soup.new_tag("a", href=details["k8s-version-status"][k8s_version]["info"])
-                    info_a.string = details["k8s-version-status"][k8s_version]["info"]
-                    #help_a = soup.new_tag("a", href=defense["help"])
-                    
-                    if details["k8s-version-status"][k8s_version]["status"] == "DEPRECATED":
-                        compatibility.string = "Deprecated in version {}".format(k8s_version)
-                        #help_a.string = ""
-                    else:
-                        compatibility.string = "OK"
-                        #help_a.string = defense["help"]
-
-                    template_a = ""
-                    if "template" in details:
-                        template_a = self.soup.new_tag("a", href=details["template"])
-                        template_a.string = details["template"]
-
-                    info_td.append(info_a)
-                    #help_td.append(help_a)
-                    template_td.append(template_a)
-                    
-                    row.append(compatibility)
-                    row.append(info_td)
-                    #row.append(help_td)
-                    row.append(template_td)
-                    
-                    table.append(row)
-
-                technique_div.append(table)
-                tactic_div.append(technique_div)
-            
-            container_div.append(tactic_div)
-
-        return container_div
+        # Fixed name per scenario, version and tactics (the batch name) so that a re-render finds the previous pages
+        if self.output_filename is None:
+            directory = "{}/{}.html-site".format(self.output_directory, report_filename(self.scenario, report.k8s_version, report.selected_tactics))
+        else:
+            directory = self.get_output_filename("Analyzer-Output", "html-site")
+        with self.profiler.stage("output:html-site"):
+            self.write_site_assets()
+            generation_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+            pages = {"index.html": self.render_site_index(report, generation_time)}
+            for position in range(len(report.tactics)):
+                pages.update(self.render_site_tactic(report, position))
+            written, unchanged = self.write_site_pages(directory, pages)
+        self.profiler.count("site_pages_written", written)
+        self.profiler.count("site_pages_unchanged", unchanged)
+        print("[*] Site {}: {} page(s) written, {} unchanged".format(directory, written, unchanged), file=sys.stderr)
+
+    site_script = """// Technique tables are loaded from their chunk the first time their section is opened
+function siteChunk(key, html) {
+    var target = document.getElementById("chunk-" + key);
+    if (target) {
+        target.innerHTML = html;
+    }
+}
+document.addEventListener("toggle", function (event) {
+    var section = event.target;
+    if (!section.open || !section.dataset || !section.dataset.chunk || section.dataset.loaded) {
+        return;
+    }
+    section.dataset.loaded = "1";
+    var script = document.createElement("script");
+    script.src = section.dataset.chunk;
+    document.head.appendChild(script);
+}, true);
+"""
+
+    # Shared stylesheet (the <style> of the html template) and chunk loader, rewritten only when they change
+    def write_site_assets(self):
+        with open("{}/{}".format(self.asset_directory, self.html_template), "r") as f:
+            styles = re.findall(r"<style[^>]*>(.*?)</style>", f.read(), re.DOTALL | re.IGNORECASE)
+        stylesheet = "\n".join(textwrap.dedent(style).strip("\n") for style in styles)
+        stylesheet += "\nsummary {\n    cursor: pointer;\n    font-weight: bold;\n    margin: 10px;\n}\n"
+
+        directory = "{}/site-assets".format(self.output_directory)
+        os.makedirs(directory, exist_ok=True)
+        for name, content in (("style.css", stylesheet), ("site.js", self.site_script)):
+            path = "{}/{}".format(directory, name)
+            try:
+                with open(path, "r") as f:
+                    if f.read() == content:
+                        continue
+            except OSError:
+                pass
+            # Batch processes may write the assets at the same time: replace the file in one step
+            temporary = self.temporary_path(path)
+            with open(temporary, "w") as f:
+                f.write(content)
+            os.replace(temporary, path)
+
+    # Page of the site linking the shared assets (pages are one level below the output directory)
+    @staticmethod
+    def site_page(title, body):
+        return "".join((
+            "<!DOCTYPE html>\n<html>\n <head>\n",
+            "  <meta charset=\"utf-8\">\n",
+            "  <title>\n   {}\n  </title>\n".format(HtmlStream.escape(title)),
+            "  <link rel=\"stylesheet\" href=\"../site-assets/style.css\">\n",
+            "  <script src=\"../site-assets/site.js\"></script>\n",
+            " </head>\n <body>\n", body, " </body>\n</html>\n"))
+
+    # Index page: one row per tactic with the number of techniques of each score
+    def render_site_index(self, report, generation_time):
+        html = HtmlStream(2)
+        html.open("div", id="container")
+        html.element("h1", "Kubernetes defense report generated on {} - Version {}".format(generation_time, report.k8s_version))
+        html.element("h2", report.name)
+
+        html.open("table", id="tactics")
+        html.open("tr", **{"class": "head"})
+        for header in ("Tactic", "Techniques", "Full Impact", "Partial Impact", "Low Impact"):
+            html.element("th", header)
+        html.close("tr")
+        for tactic in report.tactics:
+            impacts = [technique.impact for technique in tactic.techniques]
+            html.open("tr")
+            html.open("td")
+            html.element("a", tactic.name, href="{}.html".format(tactic.name))
+            html.close("td")
+            html.element("td", str(len(impacts)))
+            for impact in ("FULL IMPACT", "PARTIAL IMPACT", "LOW IMPACT"):
+                html.element("td", str(impacts.count(impact)))
+            html.close("tr")
+        html.close("table")
+        html.close("div")
+        return self.site_page("{} - Version {}".format(report.name, report.k8s_version), html.drain())
+
+    # Tactic page (no generation time, so that it stays unchanged between renders) and its technique chunks
+    def render_site_tactic(self, report, position):
+        tactic = report.tactics[position]
+        pages = {}
+        html = HtmlStream(2)
+        html.open("div", id="container")
+        html.element("h1", "{} - Version {}".format(report.name, report.k8s_version))
+        html.open("p")
+        html.element("a", "Index", href="index.html")
+        html.close("p")
+
+        html.open("div", id="sub-container")
+        html.element("h2", tactic.name)
+        for number, technique in enumerate(tactic.techniques):
+            key = "{}-{}".format(tactic.name, number)
+            chunk = "chunks/{}.js".format(key)
+            html.open("details", **{"class": "techniqueDiv", "id": "technique-{}".format(key), "data-chunk": chunk})
+            html.open("summary")
+            html.text("{}-{}".format(technique.id, technique.name))
+            self.html_impact_score(html, technique.impact)
+            html.close("summary")
+            html.element("div", "Loading...", id="chunk-{}".format(key))
+            html.close("details")
+
+            table = HtmlStream()
+            self.html_build_defense_table(table, technique, report.k8s_version)
+            pages[chunk] = "siteChunk({}, {});\n".format(json.dumps(key), json.dumps(table.drain()))
+        html.close("div")
+        html.close("div")
+
+        pages["{}.html".format(tactic.name)] = self.site_page("{} - {}".format(report.name, tactic.name), html.drain())
+        return pages
+
+    # Write the pages whose digest differs from the previous render of the site (recorded in .pages.json) and
+    # remove the pages it no longer has. Returns the number of pages written and unchanged. --no-cache rewrites
+    # every page
+    def write_site_pages(self, directory, pages):
+        os.makedirs("{}/chunks".format(directory), exist_ok=True)
+        manifest_path = "{}/.pages.json".format(directory)
+        try:
+            with open(manifest_path, "r") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+        written = previous if self.use_cache else {}
+
+        digests = {path: hashlib.sha256(content.encode()).hexdigest() for path, content in pages.items()}
+        changed = [path for path in pages if written.get(path) != digests[path] or not os.path.exists("{}/{}".format(directory, path))]
+
+        for path in changed:
+            with open("{}/{}".format(directory, path), "w") as f:
+                f.write(pages[path])
+
+        for path in previous:
+            if path not in pages and os.path.exists("{}/{}".format(directory, path)):
+                os.remove("{}/{}".format(directory, path))
+        with open(manifest_path, "w") as f:
+            json.dump(digests, f, indent=1, sort_keys=True)
+        self.profiler.count("bytes_written:html-site", sum(len(pages[path]) for path in changed))
+        return len(changed), len(pages) - len(changed)
 
     # Build html file for getting started mode
-    def soup_build_get_started_template(self, report_title_h1):
-        container_div = self.soup.new_tag("div", id="container")
-        
-        container_div.append(report_title_h1)
+    def html_build_get_started_template(self, html, title_string):
+        html.open("div", id="container")
+        html.element("h1", title_string)
 
         for defense_id in self.templates.keys():
-            defense_div = self.soup.new_tag("div", id="{}".format(defense_id), **{'class': 'techniqueDiv'})
-            technique_name_h3 = self.soup.new_tag("h3")
-            technique_name_h3.string = "{}-{}".format(defense_id, self.templates[defense_id]["defense_name"])
-            defense_div.append(technique_name_h3) 
+            html.open("div", **{"class": "techniqueDiv", "id": defense_id})
+            html.element("h3", "{}-{}".format(defense_id, self.templates[defense_id]["defense_name"]))
 
-            defense_p = self.soup.new_tag("p")
-            defense_a = self.soup.new_tag("a", href=self.templates[defense_id]["template"])
-            defense_a.string = self.templates[defense_id]["template"]
-            defense_p.string = "Gist Link: "
-            defense_p.append(defense_a)
+            html.open("p")
+            html.text("Gist Link: ")
+            html.element("a", self.templates[defense_id]["template"], href=self.templates[defense_id]["template"])
+            html.close("p")
 
-            defense_div.append(defense_p)
+            html.close("div")
+            yield html.drain()
 
-            container_div.append(defense_div)
-        return container_div
+        html.close("div")
+        yield html.drain()
 
     # Get template data for selected tactics from storage
     def get_only_templates(self):
-        Worker.load_data_from_file()
-        
-        self.templates = {}
+        with self.profiler.stage("collect_templates"):
+            self.collect_templates()
+
+        if "json" in self.outputs:
+            filename = self.write_output("Template-Output", "json", (self.tactics,), lambda: [json.dumps(self.templates, indent=4)])
+            if self.echo:
+                with open(filename, "r") as f:
+                    print(f.read())
+
+        if any(output != "json" for output in self.outputs):
+            self.output_html(None, "template")
+
+    # Templates of the defense measures used by the selected tactics
+    def collect_templates(self):
+        self.templates = self.kb.templates_for(self.tactics)
+
+    # Smallest/cheapest set of measures mitigating (at least one listed defense) every selected technique.
+    # Coverage mode counts a technique as covered only when all its listed defenses are deployed, the techniques
+    # mitigated here are covered or partially covered there
+    def get_optimized_defenses(self, scenarios, k8s_version, costs, exact_limit):
+        start = time.perf_counter()
+        selected_mask = self.kb.selected_rows(scenarios, self.tactics)
+
+        covers = {}
+        coverable = 0
+        for defense_id, mask in self.kb.cover_masks(k8s_version).items():
+            mask &= selected_mask
+            if mask:
+                covers[defense_id] = mask
+                coverable |= mask
+        costs = {defense_id: costs.get(defense_id, 1) for defense_id in covers}
+
+        with self.profiler.stage("optimize"):
+            chosen = greedy_set_cover(coverable, covers, costs)
+            algorithm = "greedy"
+            if len(covers) <= exact_limit:
+                chosen, complete = exact_set_cover(coverable, covers, costs, chosen, node_limit=200000)
+                algorithm = "exact" if complete else "exact (node limit reached, best found)"
+        elapsed = time.perf_counter() - start
+
+        self.optimization = {
+            "version": k8s_version,
+            "algorithm": algorithm,
+            "runtime_ms": round(elapsed * 1000, 3),
+            "criterion": optimize_criterion,
+            "techniques": selected_mask.bit_count(),
+            "total_cost": sum(costs[defense_id] for defense_id in chosen),
+            "measures": [],
+            "uncoverable": [],
+        }
+        positions = {defense_id: position for position, defense_id in enumerate(covers)}
+        for defense_id in sorted(chosen, key=positions.__getitem__):
+            details = self.get_defense_details(defense_id)
+            self.optimization["measures"].append({
+                "id": defense_id,
+                "name": details.name,
+                "category": details.category,
+                "cost": costs[defense_id],
+                "techniques": covers[defense_id].bit_count(),
+            })
+
+        rows = selected_mask & ~coverable
+        while rows:
+            bit = rows & -rows
+            rows ^= bit
+            scenario_index, tactic, technique = self.kb.technique(bit.bit_length() - 1)
+            self.optimization["uncoverable"].append({
+                "scenario": self.kb.scenario_headers[scenario_index][0],
+                "tactic": tactic,
+                "id": technique["id"],
+                "name": technique["name"],
+            })
 
-        if "All" in self.tactics:
-            for defense_measure in self.defense_measures["DefenseMeasures"]:
-                for sub_measure in defense_measure["sub-measures"]:
-                    if "template" in sub_measure:
-                        self.templates[sub_measure["id"]] = {}
-                        self.templates[sub_measure["id"]]["defense_name"] = sub_measure["name"]
-                        self.templates[sub_measure["id"]]["template"] = sub_measure["template"]
-        else:
-            defense_ids = []
-            for tactic in self.tactics:
-                for scenario in self.impact_measures["Scenarios"]:
-                    if tactic in scenario["tactics"]:
-                        for technique in scenario["tactics"][tactic]["techniques"]:
-                            for defense in technique["defenses"]:
-                                defense_ids.append(defense["id"])
-            
-            formatted_defense_ids = []
-            for defense_id in defense_ids:
-                if len(defense_id.split(".")) == 3:
-                    formatted_defense_ids.append(".".join(defense_id.split(".")[0:2]))
-                else:
-                    formatted_defense_ids.append(defense_id)
-            
-            for defense_measure in self.defense_measures["DefenseMeasures"]:
-                for sub_measure in defense_measure["sub-measures"]:
-                    if "template" in sub_measure:
-                        if sub_measure["id"] in formatted_defense_ids:
-                            self.templates[sub_measure["id"]] = {}
-                            self.templates[sub_measure["id"]]["defense_name"] = sub_measure["name"]
-                            self.templates[sub_measure["id"]]["template"] = sub_measure["template"]
-        
         if self.output == "json":
+            if not os.path.exists(self.output_directory):
+                os.makedirs(self.output_directory)
 
-            filename = "{}/Template-Output-{}.json".format(self.output_directory, datetime.now())
+            dump_string = json.dumps(self.optimization, indent=4)
+            filename = self.get_output_filename("Optimize-Output", "json")
             with open(filename, "w") as f:
-                json.dump(self.templates, f, indent=4)
-            print(json.dumps(self.templates, indent=4))
+                f.write(dump_string)
+            print(dump_string)
+        else:
+            self.optimize_output_stdout()
+
+    def optimize_output_stdout(self):
+        with self.terminal() as terminal:
+            terminal.write("{}\nMinimal defense set for {} techniques - Version {}\nCriterion: {}\n\n".format(
+                report_separator, self.optimization["techniques"], self.optimization["version"], self.optimization["criterion"]))
+            for measure in self.optimization["measures"]:
+                terminal.write(" {} {}\n     Category: {}\n     Cost: {}\n     Mitigated techniques: {}\n".format(
+                    measure["id"], measure["name"], measure["category"], measure["cost"], measure["techniques"]))
+            terminal.write("\nTotal cost: {}\n".format(self.optimization["total_cost"]))
+            if self.optimization["uncoverable"]:
+                terminal.write(terminal.paint("Techniques without a usable defense measure in version {}:".format(self.optimization["version"]), "red") + "\n")
+                for technique in self.optimization["uncoverable"]:
+                    terminal.write(" Scenario {} #{} {}-{}\n".format(technique["scenario"], technique["tactic"], technique["id"], technique["name"]))
+            terminal.write("Algorithm: {}, runtime {:.2f} ms\n{}\n".format(self.optimization["algorithm"], self.optimization["runtime_ms"], report_separator))
+
+    # Evaluate deployed defense profiles against every scenario/technique in each k8s version
+    def get_coverage(self, profiles, k8s_versions):
+        start = time.perf_counter()
+        selected_mask = self.kb.selected_rows(None, self.tactics)
+
+        self.coverage = []
+        with self.profiler.stage("coverage"):
+            for name, defense_ids in profiles.items():
+                deployed = self.kb.expand_deployed(defense_ids)
+                for k8s_version in k8s_versions:
+                    full, partial = self.kb.row_coverage(deployed, k8s_version)
+                    self.coverage.append((name, k8s_version, full & selected_mask, partial & selected_mask, selected_mask))
+        elapsed = time.perf_counter() - start
+
+        with self.profiler.stage("output:{}".format(self.output)):
+            if self.output == "json":
+                self.coverage_output_json()
+            else:
+                self.coverage_output_stdout()
+        print("[*] Evaluated {} profile(s) x {} version(s) in {:.2f} ms".format(len(profiles), len(k8s_versions), elapsed * 1000), file=sys.stderr)
+
+    # Per scenario counts of covered, partially covered and uncovered techniques
+    def coverage_summary(self, full, partial, selected_mask):
+        summary = []
+        for scenario_index, scenario_mask in enumerate(self.kb.scenario_row_masks):
+            techniques = selected_mask & scenario_mask
+            if not techniques:
+                continue
+            covered = full & scenario_mask
+            summary.append((scenario_index, {
+                "id": self.kb.scenario_headers[scenario_index][0],
+                "name": self.kb.scenario_headers[scenario_index][1],
+                "total": techniques.bit_count(),
+                "covered": covered.bit_count(),
+                "partial": (partial & scenario_mask).bit_count(),
+                "uncovered": (techniques & ~covered & ~partial).bit_count(),
+                "covered_by_impact": {impact: (covered & mask).bit_count() for impact, mask in self.kb.impact_row_masks.items() if covered & mask},
+            }))
+        return summary
+
+    def coverage_output_stdout(self):
+        with self.terminal() as terminal:
+            terminal.write(report_separator + "\n")
+            for name, k8s_version, full, partial, selected_mask in self.coverage:
+                terminal.write(terminal.paint("#{} - Version {}".format(name, k8s_version), "cyan") + "\n")
+                for _, scenario in self.coverage_summary(full, partial, selected_mask):
+                    lines = [" {}\n     Covered techniques: {}/{}\n     Partially covered techniques: {}\n     Uncovered techniques: {}\n".format(
+                        scenario["name"], scenario["covered"], scenario["total"], scenario["partial"], scenario["uncovered"])]
+                    for impact, count in scenario["covered_by_impact"].items():
+                        lines.append("         {}: {}\n".format(impact, count))
+                    terminal.write("".join(lines))
+                terminal.write("\n")
+            terminal.write(report_separator + "\n")
+
+    def coverage_output_json(self):
+        if not os.path.exists(self.output_directory):
+            os.makedirs(self.output_directory)
 
+        dump = []
+        for name, k8s_version, full, partial, selected_mask in self.coverage:
+            scenarios = []
+            for scenario_index, scenario in self.coverage_summary(full, partial, selected_mask):
+                techniques = []
+                rows = selected_mask & self.kb.scenario_row_masks[scenario_index]
+                while rows:
+                    bit = rows & -rows
+                    rows ^= bit
+                    _, tactic, technique = self.kb.technique(bit.bit_length() - 1)
+                    techniques.append({
+                        "tactic": tactic,
+                        "id": technique["id"],
+                        "name": technique["name"],
+                        "impact": technique["impact"],
+                        "coverage": "covered" if full & bit else "partial" if partial & bit else "uncovered",
+                    })
+                scenario["techniques"] = techniques
+                scenarios.append(scenario)
+            dump.append({"profile": name, "version": k8s_version, "scenarios": scenarios})
+
+        dump_string = json.dumps(dump, indent=4)
+        filename = self.get_output_filename("Coverage-Output", "json")
+        with open(filename, "w") as f:
+            f.write(dump_string)
+        if self.echo:
+            print(dump_string)
+
+    # Upgrade delta between two k8s versions: stdout first, then every requested file from the same delta
+    def get_version_diff(self, scenarios, from_version, to_version):
+        with self.profiler.stage("version_diff"):
+            delta = self.build_version_delta(scenarios, from_version, to_version)
+
+        if "stdout" in self.outputs:
+            with self.profiler.stage("output:stdout"):
+                self.diff_output_stdout(delta)
+
+        cache_parts = (tuple(scenarios), delta.selected_tactics, from_version, to_version)
+        for output in self.outputs:
+            if output == "json":
+                filename = self.write_output("Diff-Output", "json", cache_parts, lambda: [self.render_diff_json(delta)])
+                if self.echo:
+                    with open(filename, "r") as f:
+                        print(f.read())
+            elif output == "txt":
+                self.write_output("Diff-Output", "txt", cache_parts, lambda: self.render_diff_txt(delta))
+            elif output == "html":
+                if not os.path.exists(self.asset_directory):
+                    print("[!][!] Directory {} does not exist".format(self.asset_directory))
+                    sys.exit(2)
+                self.write_output("Diff-Output", "html", cache_parts, lambda: self.render_diff_html(delta))
+
+    # Changed measures come from the version index, affected techniques from their incidence bitsets:
+    # only techniques listing a changed measure are resolved
+    def build_version_delta(self, scenarios, from_version, to_version):
+        selected_mask = self.kb.selected_rows(scenarios, self.tactics)
+
+        changes = self.kb.version_changes(from_version, to_version)
+        changed_ids = set(changes)
+        rows = 0
+        measures = []
+        for defense_id in changes:
+            mask = self.kb.defense_row_masks.get(defense_id, 0) & selected_mask
+            rows |= mask
+            details = self.get_defense_details(defense_id)
+            from_status, from_info = details.version_status(from_version)
+            to_status, to_info = details.version_status(to_version)
+            measures.append(DeltaMeasure(defense_id, details.name, details.category, from_status, from_info, to_status, to_info, mask.bit_count()))
+
+        from_deprecated = self.kb.deprecated_ids.get(from_version, frozenset())
+        to_deprecated = self.kb.deprecated_ids.get(to_version, frozenset())
+        techniques = {}
+        while rows:
+            bit = rows & -rows
+            rows ^= bit
+            scenario_index, tactic, technique = self.kb.technique(bit.bit_length() - 1)
+            defense_ids = [defense["id"] for defense in technique["defenses"]]
+            techniques.setdefault(scenario_index, []).append(DeltaTechnique(
+                tactic, technique["id"], technique["name"], technique["impact"], len(defense_ids),
+                sum(defense_id not in from_deprecated for defense_id in defense_ids),
+                sum(defense_id not in to_deprecated for defense_id in defense_ids),
+                tuple(defense_id for defense_id in defense_ids if defense_id in changed_ids)))
+
+        delta_scenarios = tuple(DeltaScenario(self.kb.scenario_headers[scenario_index][0], self.kb.scenario_headers[scenario_index][1], tuple(scenario_techniques))
+                                for scenario_index, scenario_techniques in sorted(techniques.items()))
+        return VersionDelta(from_version, to_version, tuple(self.tactics), tuple(measures), delta_scenarios)
+
+    def diff_output_stdout(self, delta):
+        with self.terminal() as terminal:
+            terminal.write("{}\nDefense measure changes from version {} to {}\n\n".format(report_separator, delta.from_version, delta.to_version))
+
+            if not delta.measures:
+                terminal.write("No defense measure changes status or info\n")
+            for measure in delta.measures:
+                lines = [" {} {}\n     Category: {}\n".format(measure.id, measure.name, measure.category)]
+                if measure.from_status != measure.to_status:
+                    lines.append("     Status: {} -> {}\n".format(measure.from_status, terminal.paint(measure.to_status, "red" if measure.to_status == "DEPRECATED" else "green")))
+                if measure.from_info != measure.to_info:
+                    lines.append("     Info: {} -> {}\n".format(measure.from_info, measure.to_info))
+                lines.append("     Affected techniques: {}\n".format(measure.techniques))
+                terminal.write("".join(lines))
+            terminal.write("\n")
+
+            for scenario in delta.scenarios:
+                terminal.write(terminal.paint("#{}".format(scenario.name), "cyan") + "\n")
+                for technique in scenario.techniques:
+                    effective = "{}/{} -> {}/{}".format(technique.from_effective, technique.defenses, technique.to_effective, technique.defenses)
+                    if technique.to_effective < technique.from_effective:
+                        effective = terminal.paint(effective, "red" if technique.to_effective == 0 else "magenta")
+                    elif technique.to_effective > technique.from_effective:
+                        effective = terminal.paint(effective, "green")
+                    terminal.write(" {} {}-{}\n     Changed defense measures: {}\n     Defense measures in effect: {}\n     Impact of defensive measures: {}\n".format(
+                        technique.tactic, technique.id, technique.name, ", ".join(technique.changed), effective, technique.impact))
+                terminal.write("\n")
+
+            terminal.write(report_separator + "\n")
+
+    def render_diff_json(self, delta):
+        dump = {
+            "from": delta.from_version,
+            "to": delta.to_version,
+            "measures": [{
+                "id": measure.id,
+                "name": measure.name,
+                "category": measure.category,
+                "from": {"status": measure.from_status, "info": measure.from_info},
+                "to": {"status": measure.to_status, "info": measure.to_info},
+                "techniques": measure.techniques,
+            } for measure in delta.measures],
+            "scenarios": [{
+                "id": scenario.id,
+                "name": scenario.name,
+                "techniques": [{
+                    "tactic": technique.tactic,
+                    "id": technique.id,
+                    "name": technique.name,
+                    "impact": technique.impact,
+                    "changed": list(technique.changed),
+                    "defenses": technique.defenses,
+                    "effective": {"from": technique.from_effective, "to": technique.to_effective},
+                } for technique in scenario.techniques],
+            } for scenario in delta.scenarios],
+        }
+        return json.dumps(dump, indent=4)
+
+    def render_diff_txt(self, delta):
+        yield "Defense measure changes from version {} to {}\n\n".format(delta.from_version, delta.to_version)
+        for measure in delta.measures:
+            lines = [" {} {}\n".format(measure.id, measure.name), "     Category: {}\n".format(measure.category)]
+            if measure.from_status != measure.to_status:
+                lines.append("     Status: {} -> {}\n".format(measure.from_status, measure.to_status))
+            if measure.from_info != measure.to_info:
+                lines.append("     Info: {} -> {}\n".format(measure.from_info, measure.to_info))
+            lines.append("     Affected techniques: {}\n".format(measure.techniques))
+            yield "".join(lines)
+        yield "\n"
+
+        for scenario in delta.scenarios:
+            yield "#{}\n".format(scenario.name)
+            for technique in scenario.techniques:
+                yield "".join([
+                    " {} {}-{}\n".format(technique.tactic, technique.id, technique.name),
+                    "     Changed defense measures: {}\n".format(", ".join(technique.changed)),
+                    "     Defense measures in effect: {}/{} -> {}/{}\n".format(technique.from_effective, technique.defenses, technique.to_effective, technique.defenses),
+                    "     Impact of defensive measures: {}\n".format(technique.impact),
+                ])
+            yield "\n"
+
+    # Html delta: a table of changed measures, then one table per scenario of the techniques they affect
+    def render_diff_html(self, delta):
+        generation_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+        template = HtmlTemplate("{}/{}".format(self.asset_directory, self.html_template), "Output {}".format(generation_time))
+        html = HtmlStream(template.body_depth)
+
+        yield template.head
+        html.open("div", id="container")
+        html.element("h1", "Kubernetes defense changes from version {} to {} generated on {}".format(delta.from_version, delta.to_version, generation_time))
+
+        html.open("div", id="sub-container")
+        html.element("h2", "Changed defense measures")
+        html.open("table", id="table-measures")
+        html.open("tr")
+        for header in ("Id", "Measure", "Category", "Version {}".format(delta.from_version), "Version {}".format(delta.to_version), "Affected techniques"):
+            html.element("th", header)
+        html.close("tr")
+        for measure in delta.measures:
+            html.open("tr")
+            html.element("td", measure.id)
+            html.element("td", measure.name)
+            html.element("td", measure.category)
+            for status, info in ((measure.from_status, measure.from_info), (measure.to_status, measure.to_info)):
+                html.open("td")
+                html.element("span", status, **{"class": "full" if status == "DEPRECATED" else "low"})
+                if info:
+                    html.element("a", info, href=info)
+                html.close("td")
+            html.element("td", str(measure.techniques))
+            html.close("tr")
+        html.close("table")
+        html.close("div")
+        yield html.drain()
+
+        for scenario in delta.scenarios:
+            html.open("div", id="sub-container")
+            html.element("h2", scenario.name)
+            html.open("table")
+            html.open("tr")
+            for header in ("Tactic", "Technique", "Score", "Changed measures", "Measures in effect"):
+                html.element("th", header)
+            html.close("tr")
+            for technique in scenario.techniques:
+                html.open("tr")
+                html.element("td", technique.tactic)
+                html.element("td", "{}-{}".format(technique.id, technique.name))
+                html.element("td", technique.impact)
+                html.element("td", ", ".join(technique.changed))
+                html.open("td")
+                effective = "{}/{} -> {}/{}".format(technique.from_effective, technique.defenses, technique.to_effective, technique.defenses)
+                if technique.to_effective < technique.from_effective:
+                    html.element("span", effective, **{"class": "full" if technique.to_effective == 0 else "partial"})
+                else:
+                    html.element("span", effective, **{"class": "low"})
+                html.close("td")
+                html.close("tr")
+            html.close("table")
+            html.close("div")
+            yield html.drain()
+
+        html.close("div")
+        yield html.drain()
+        yield template.tail
+
+# Weighted greedy set cover with lazy gain updates (gains only shrink, so a refreshed
+# candidate still at the top of the heap is the best one), followed by removal of redundant picks
+def greedy_set_cover(universe, covers, costs):
+    heap = [(-covers[defense_id].bit_count() / costs[defense_id], position, defense_id) for position, defense_id in enumerate(covers)]
+    heapq.heapify(heap)
+    uncovered = universe
+    chosen = []
+    while uncovered and heap:
+        _, position, defense_id = heapq.heappop(heap)
+        gain = (covers[defense_id] & uncovered).bit_count()
+        if gain == 0:
+            continue
+        ratio = gain / costs[defense_id]
+        if heap and ratio < -heap[0][0]:
+            heapq.heappush(heap, (-ratio, position, defense_id))
+            continue
+        chosen.append(defense_id)
+        uncovered &= ~covers[defense_id]
+
+    for defense_id in sorted(chosen, key=costs.__getitem__, reverse=True):
+        others = 0
+        for other in chosen:
+            if other != defense_id:
+                others |= covers[other]
+        if universe & ~others == 0:
+            chosen.remove(defense_id)
+    return chosen
+
+# Exact minimum cost set cover by branch and bound, branching on the candidates covering the lowest
+# uncovered row. Returns the best cover found and whether the search completed within the node limit
+def exact_set_cover(universe, covers, costs, initial_cover, node_limit):
+    candidates = sorted(covers, key=costs.__getitem__)
+    best = {"cover": list(initial_cover), "cost": sum(costs[defense_id] for defense_id in initial_cover), "nodes": 0}
+
+    def search(uncovered, chosen, cost):
+        if not uncovered:
+            if cost < best["cost"]:
+                best["cover"], best["cost"] = list(chosen), cost
+            return
+        best["nodes"] += 1
+        if best["nodes"] > node_limit:
+            return
+        row = uncovered & -uncovered
+        for defense_id in candidates:
+            if covers[defense_id] & row and cost + costs[defense_id] < best["cost"]:
+                chosen.append(defense_id)
+                search(uncovered & ~covers[defense_id], chosen, cost + costs[defense_id])
+                chosen.pop()
+
+    search(universe, [], 0)
+    return best["cover"], best["nodes"] <= node_limit
+
+# Process pool initializer: share the knowledge base loaded once by the parent process
+def init_batch_process(kb, profiler_enabled, track_memory):
+    Worker.set_knowledge_base(kb)
+    Worker.profiler = Profiler(profiler_enabled, track_memory)
+
+# Render a single cell of the batch matrix, returns its wall time and what the worker process profiled
+def run_batch_cell(cell):
+    scenario, k8s_version, tactics, output, filename, use_cache, compact = cell
+    start = time.perf_counter()
+    worker = Worker("analyzer", tactics, output)
+    worker.output_filename = filename
+    worker.echo = False
+    worker.use_cache = use_cache
+    worker.compact = compact
+    worker.get_scenario_data(scenario, k8s_version)
+    elapsed = time.perf_counter() - start
+
+    # Measurements are handed back to the parent once per cell
+    stages, counters = Worker.profiler.stages, Worker.profiler.counters
+    Worker.profiler.stages, Worker.profiler.counters = {}, {}
+    return elapsed, stages, counters
+
+# Cells of the scenario x k8s version x tactic set matrix
+def batch_cells(scenarios, k8s_versions, tactic_sets, output, use_cache, compact):
+    cells = []
+    for scenario in scenarios:
+        for k8s_version in k8s_versions:
+            for tactics in tactic_sets:
+                cells.append((scenario, k8s_version, tactics, output, report_filename(scenario, k8s_version, tactics), use_cache, compact))
+    return cells
+
+# Fixed report name of a scenario x k8s version x tactic set (batch reports, html sites)
+def report_filename(scenario, k8s_version, tactics):
+    return "Analyzer-Output-S{}-v{}-{}".format(scenario + 1, k8s_version, "+".join(tactics))
+
+# Render batch cells with a process pool (in this process when a single one is enough)
+def render_batch(cells, jobs):
+    if not os.path.exists(Worker.output_directory):
+        os.makedirs(Worker.output_directory)
+
+    jobs = max(1, min(jobs, len(cells)))
+    start = time.perf_counter()
+    if jobs == 1:
+        results = [run_batch_cell(cell) for cell in cells]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_batch_process,
+                                 initargs=(Worker.kb, Worker.profiler.enabled, Worker.profiler.track_memory)) as executor:
+            results = list(executor.map(run_batch_cell, cells))
+    elapsed = time.perf_counter() - start
+
+    timings = []
+    for timing, stages, counters in results:
+        timings.append(timing)
+        Worker.profiler.merge(stages, counters)
+
+    print("{:<10}{:<10}{:<50}{:>12}  {}".format("Scenario", "Version", "Tactics", "Time (ms)", "File"))
+    for cell, timing in zip(cells, timings):
+        output = cell[3]
+        print("{:<10}{:<10}{:<50}{:>12.1f}  {}/{}.{}".format(cell[0] + 1, cell[1], " ".join(cell[2]), timing * 1000, Worker.output_directory, cell[4], output[0] if len(output) == 1 else "{{{}}}".format(",".join(output))))
+    print("[*] {} reports in {:.1f} ms with {} process(es), {:.1f} ms of rendering".format(len(cells), elapsed * 1000, jobs, sum(timings) * 1000))
+
+# Analyze every scenario x k8s version x tactic set cell
+def run_batch(scenarios, k8s_versions, tactic_sets, output, jobs, use_cache, compact):
+    if Worker.kb is None:
+        Worker.load_data_from_file()
+    render_batch(batch_cells(scenarios, k8s_versions, tactic_sets, output, use_cache, compact), jobs)
+
+# Batch reports depending on each defense measure: defense id -> (scenario index, tactic) of the techniques listing it
+def defense_dependencies(kb):
+    dependencies = {}
+    for defense_id, mask in kb.defense_row_masks.items():
+        uses = dependencies.setdefault(defense_id, set())
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            scenario_index, tactic, _ = kb.technique_rows[bit.bit_length() - 1]
+            uses.add((scenario_index, tactic))
+    return dependencies
+
+# Reports whose content differs between two knowledge bases: (scenario index, k8s version) -> changed tactics.
+# Techniques are compared per scenario tactic; a changed measure affects the tactics using it (before or after
+# the edit), in every version or only in the versions whose status/info changed. Json reports list the status
+# of every version, a status change affects them in all versions: (scenario index, None) -> changed tactics
+def diff_knowledge_bases(old, new, k8s_versions):
+    affected = {}
+    def mark(scenario_index, tactics, versions):
+        for k8s_version in versions:
+            affected.setdefault((scenario_index, k8s_version), set()).update(tactics)
+
+    old_scenarios = old.impact_measures["Scenarios"]
+    new_scenarios = new.impact_measures["Scenarios"]
+    for scenario_index in range(max(len(old_scenarios), len(new_scenarios))):
+        if scenario_index >= len(old_scenarios) or scenario_index >= len(new_scenarios):
+            scenario = (new_scenarios if scenario_index < len(new_scenarios) else old_scenarios)[scenario_index]
+            mark(scenario_index, scenario["tactics"], k8s_versions)
+            continue
+        old_scenario = old_scenarios[scenario_index]
+        new_scenario = new_scenarios[scenario_index]
+        if old_scenario["id"] != new_scenario["id"] or old_scenario["name"] != new_scenario["name"]:
+            mark(scenario_index, set(old_scenario["tactics"]) | set(new_scenario["tactics"]), k8s_versions)
+            continue
+        for tactic in set(old_scenario["tactics"]) | set(new_scenario["tactics"]):
+            if old_scenario["tactics"].get(tactic) != new_scenario["tactics"].get(tactic):
+                mark(scenario_index, [tactic], k8s_versions)
+
+    old_dependencies = defense_dependencies(old)
+    new_dependencies = defense_dependencies(new)
+    for defense_id in set(old_dependencies) | set(new_dependencies):
+        old_record = old.defense_index.get(defense_id)
+        new_record = new.defense_index.get(defense_id)
+        if old_record is None or new_record is None or any(getattr(old_record, field) != getattr(new_record, field) for field in ("name", "category", "type", "template")):
+            versions = k8s_versions
         else:
-            self.output_html(k8s_version="", mode="template")
-        
+            versions = [k8s_version for k8s_version in k8s_versions if old_record.version_status(k8s_version) != new_record.version_status(k8s_version)]
+            if old_record.k8s_version_status != new_record.k8s_version_status:
+                versions.append(None)
+        if versions:
+            for scenario_index, tactic in old_dependencies.get(defense_id, set()) | new_dependencies.get(defense_id, set()):
+                mark(scenario_index, [tactic], versions)
+    return affected
+
+# Keep batch reports up to date: poll the knowledge base files and the html template, and re-render only
+# the reports depending on what changed
+def watch(scenarios, all_scenarios, k8s_versions, tactic_sets, output, jobs, use_cache, compact, interval):
+    run_batch(scenarios, k8s_versions, tactic_sets, output, jobs, use_cache, compact)
+    template_digest = Worker.template_digest()
+    failed_sources = None
+    print("[*] Watching {}, {} and {}/{} (every {} s, Ctrl+C to stop)".format(
+        Worker.defense_measures_path, Worker.scenario_impact_analysis_path, Worker.asset_directory, Worker.html_template, interval))
+
+    while True:
+        time.sleep(interval)
+        cells = {}
+        def schedule(cell, cell_output):
+            scheduled = cells.get(cell[4])
+            if scheduled is not None:
+                cell_output = [extension for extension in output if extension in scheduled[3] or extension in cell_output]
+            cells[cell[4]] = cell[:3] + (cell_output,) + cell[4:]
+
+        sources = KnowledgeBase.check_sources(Worker.kb.sources)
+        if sources != Worker.kb.sources:
+            stats = []
+            for path in Worker.kb.sources:
+                try:
+                    stat = os.stat(path)
+                    stats.append((stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    stats.append(None)
+            # A file saved half way stays broken until it is written again, it is not re-read on every poll
+            if stats != failed_sources:
+                try:
+                    kb = KnowledgeBase.load(Worker.defense_measures_path, Worker.scenario_impact_analysis_path, Worker.compiled_kb_path)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print("[!] Could not load the knowledge base, keeping the previous one: {}".format(e))
+                    failed_sources = stats
+                    kb = None
+
+                if kb is not None:
+                    failed_sources = None
+                    changed = kb.digest != Worker.kb.digest
+                    affected = diff_knowledge_bases(Worker.kb, kb, k8s_versions) if changed else {}
+                    Worker.set_knowledge_base(kb)
+                    if all_scenarios:
+                        scenarios = list(range(len(kb.impact_measures["Scenarios"])))
+                    for cell in batch_cells(scenarios, k8s_versions, tactic_sets, output, use_cache, compact):
+                        if cell[0] >= len(kb.impact_measures["Scenarios"]):
+                            continue
+                        for k8s_version, cell_output in ((cell[1], output), (None, ["json"])):
+                            tactics = affected.get((cell[0], k8s_version))
+                            if tactics and ("All" in cell[2] or tactics & set(cell[2])) and set(cell_output) <= set(output):
+                                schedule(cell, cell_output)
+                                break
+                    if changed:
+                        print("[*] Knowledge base changed ({}), {} report(s) affected".format(kb.digest[:12], len(cells)))
+
+        digest = Worker.template_digest()
+        if digest != template_digest:
+            template_digest = digest
+            html_output = [extension for extension in output if extension in ("html", "html-site")]
+            if html_output:
+                html_cells = [cell for cell in batch_cells(scenarios, k8s_versions, tactic_sets, html_output, use_cache, compact)
+                              if cell[0] < len(Worker.impact_measures["Scenarios"])]
+                print("[*] Html template changed, {} html report(s) affected".format(len(html_cells)))
+                for cell in html_cells:
+                    schedule(cell, html_output)
+
+        if cells:
+            render_batch(list(cells.values()), jobs)
+
+# Cluster inventory: which defense measures a kubectl dump shows to be in place. Cluster wide objects (e.g. a
+# NetworkPolicy) evidence a measure on their own, workload and role checks are counted per resource and the
+# measure is deployed when the compliant share reaches the requested ratio
+workload_kinds = {"Pod", "Deployment", "StatefulSet", "DaemonSet", "ReplicaSet", "ReplicationController", "Job", "CronJob"}
+system_namespaces = {"kube-system", "kube-public", "kube-node-lease"}
+pod_security_levels = {
+    "baseline": ["4.1.1", "4.1.2", "4.1.3"],
+    "restricted": ["4.1.1", "4.1.2", "4.1.3", "4.1.4", "4.1.5", "6.1.1", "6.1.3", "6.1.4", "6.1.5"],
+}
+sensitive_resources = {"*", "pods", "pods/exec", "deployments", "daemonsets", "replicasets", "nodes", "secrets"}
+inventory_batch_size = 1 << 20
+inventory_parse_errors = (ValueError,) if yaml is None else (ValueError, yaml.YAMLError)
+
+# Decode a json dump one resource at a time, holding at most the current resource in memory. Accepts a
+# List object (kubectl get -o json), a top level array or concatenated objects
+def stream_json_resources(f, chunk_size):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        # Reads at least as much as is buffered, so a resource larger than a chunk is decoded a bounded number of times
+        chunk = f.read(max(chunk_size, len(buffer) - pos))
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos] if pos < len(buffer) else None
+            fill()
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError("expected {} at offset {}".format(char, f.tell()))
+        pos += 1
+
+    # A value cut at the end of the buffer fails to decode (or, for a number, decodes short as in 1.5e|3), it is
+    # retried once more data is read
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                decoded, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if not eof and (end == len(buffer) or isinstance(decoded, (int, float)) and buffer[end] not in " \t\r\n,]}"):
+                fill()
+                continue
+            pos = end
+            return decoded
+
+    def items():
+        nonlocal pos
+        expect("[")
+        while peek() != "]":
+            if peek() is None:
+                raise ValueError("unexpected end of file")
+            yield value()
+            if peek() == ",":
+                pos += 1
+        pos += 1
+
+    while peek() is not None:
+        if peek() == "[":
+            yield from items()
+        elif peek() == "{":
+            pos += 1
+            document = {}
+            found_items = False
+            while peek() != "}":
+                key = value()
+                expect(":")
+                if key == "items" and peek() == "[":
+                    found_items = True
+                    yield from items()
+                else:
+                    document[key] = value()
+                if peek() == ",":
+                    pos += 1
+                elif peek() != "}":
+                    raise ValueError("expected , or }} at offset {}".format(f.tell()))
+            pos += 1
+            if not found_items:
+                yield document
+        else:
+            value()
+
+# Split a multi-document yaml dump into documents, line by line
+def stream_yaml_documents(f):
+    document = []
+    for line in f:
+        if line.startswith("---") or line.startswith("..."):
+            if document:
+                yield "".join(document)
+                document = []
+            if line.startswith("---") and line[3:].strip():
+                document.append(line[3:].lstrip())
+            continue
+        document.append(line)
+    if document:
+        yield "".join(document)
+
+# Resources of a parsed document, List objects are flattened
+def iter_resources(document):
+    if not isinstance(document, dict):
+        return
+    if document.get("kind", "").endswith("List") and isinstance(document.get("items"), list):
+        for item in document["items"]:
+            yield from iter_resources(item)
+    else:
+        yield document
+
+# Pod metadata and spec of a workload, from its pod template for controllers
+def pod_template(resource):
+    spec = resource.get("spec") or {}
+    if resource["kind"] == "Pod":
+        return resource.get("metadata") or {}, spec
+    if resource["kind"] == "CronJob":
+        spec = (spec.get("jobTemplate") or {}).get("spec") or {}
+    template = spec.get("template") or {}
+    return template.get("metadata") or {}, template.get("spec") or {}
+
+# ServiceAccount a pod runs as
+def service_account_name(pod_spec):
+    return pod_spec.get("serviceAccountName", pod_spec.get("serviceAccount", "default"))
+
+# (defense measure id, compliant) pairs evidenced by a single resource. Compliance is None for 8.3 when the pod
+# leaves automountServiceAccountToken unset: it is decided by its ServiceAccount (see detect_inventory)
+def detect_defenses(resource):
+    kind = resource.get("kind")
+    metadata = resource.get("metadata") or {}
+    spec = resource.get("spec") or {}
+
+    if kind == "NetworkPolicy":
+        policy_types = spec.get("policyTypes") or (["Ingress", "Egress"] if "egress" in spec else ["Ingress"])
+        if "Egress" in policy_types:
+            yield from (("3.2.1", True), ("5.1.1", True))
+        if "Ingress" in policy_types:
+            yield from (("3.2.2", True), ("5.1.2", True))
+    elif kind == "PodSecurityPolicy":
+        if not spec.get("hostPID") and not spec.get("hostIPC"):
+            yield "4.1.1", True
+        if not {"*", "hostPath"} & set(spec.get("volumes") or []):
+            yield "4.1.2", True
+        if not spec.get("hostNetwork"):
+            yield "4.1.3", True
+        if spec.get("allowPrivilegeEscalation") is False:
+            yield from (("4.1.4", True), ("6.1.4", True))
+        if (spec.get("runAsUser") or {}).get("rule") == "MustRunAsNonRoot":
+            yield from (("4.1.5", True), ("6.1.3", True))
+        annotations = metadata.get("annotations") or {}
+        if "seccomp.security.alpha.kubernetes.io/allowedProfileNames" in annotations or "apparmor.security.beta.kubernetes.io/allowedProfileNames" in annotations:
+            yield "6.1.1", True
+        if spec.get("readOnlyRootFilesystem"):
+            yield "6.1.2", True
+        if "ALL" in (spec.get("requiredDropCapabilities") or []):
+            yield "6.1.5", True
+    elif kind == "Namespace":
+        level = (metadata.get("labels") or {}).get("pod-security.kubernetes.io/enforce")
+        for defense_id in pod_security_levels.get(level, ()):
+            yield defense_id, True
+    elif kind in ("ValidatingWebhookConfiguration", "MutatingWebhookConfiguration"):
+        yield "2.3", True
+    elif kind in ("Role", "ClusterRole") and not metadata.get("name", "").startswith("system:"):
+        rules = resource.get("rules") or []
+        yield "8.1", not any("*" in (rule.get(field) or []) for rule in rules for field in ("verbs", "resources", "apiGroups"))
+        yield "8.2", not any({"*", "create", "delete", "deletecollection"} & set(rule.get("verbs") or []) and sensitive_resources & set(rule.get("resources") or []) for rule in rules)
+        yield "7.3", not any({"*", "get", "list", "watch"} & set(rule.get("verbs") or []) and {"*", "secrets"} & set(rule.get("resources") or []) for rule in rules)
+    elif kind in workload_kinds:
+        pod_metadata, pod_spec = pod_template(resource)
+        containers = (pod_spec.get("containers") or []) + (pod_spec.get("initContainers") or [])
+        if any("falco" in container.get("image", "") for container in containers):
+            yield "6.4", True
+        if metadata.get("namespace") in system_namespaces or not containers:
+            return
+
+        pod_security_context = pod_spec.get("securityContext") or {}
+        yield "3.1", metadata.get("namespace", "default") != "default"
+        automount = pod_spec.get("automountServiceAccountToken")
+        yield "8.3", None if automount is None else automount is False
+        yield "8.4", service_account_name(pod_spec) not in ("", "default")
+        yield "6.2", bool(pod_security_context) or all(container.get("securityContext") for container in containers)
+        yield "6.3", ((pod_security_context.get("seccompProfile") or {}).get("type") in ("RuntimeDefault", "Localhost")
+                      or (pod_metadata.get("annotations") or {}).get("seccomp.security.alpha.kubernetes.io/pod") == "runtime/default"
+                      or all(((container.get("securityContext") or {}).get("seccompProfile") or {}).get("type") in ("RuntimeDefault", "Localhost") for container in containers))
+        yield "6.5", all({"cpu", "memory"} <= set(((container.get("resources") or {}).get("limits") or {})) for container in containers)
+        yield "7.1", not any(
+            "secretKeyRef" in (env.get("valueFrom") or {}) for container in containers for env in container.get("env") or []
+        ) and not any("secretRef" in env_from for container in containers for env_from in container.get("envFrom") or [])
+
+# Resource count, [compliant, total] per measure, automountServiceAccountToken of the ServiceAccounts setting it
+# and the number of workloads leaving it to their ServiceAccount, both by (namespace, name). A ServiceAccount
+# may come after its workloads (or in another batch): 8.3 of those workloads is resolved once the dump is read
+def inspect_documents(documents):
+    resources = 0
+    findings = {}
+    service_accounts = {}
+    token_workloads = {}
+    for document in documents:
+        for resource in iter_resources(document):
+            resources += 1
+            metadata = resource.get("metadata") or {}
+            if resource.get("kind") == "ServiceAccount" and isinstance(resource.get("automountServiceAccountToken"), bool):
+                service_accounts[(metadata.get("namespace", "default"), metadata.get("name"))] = resource["automountServiceAccountToken"]
+            for defense_id, compliant in detect_defenses(resource):
+                if compliant is None:
+                    account = (metadata.get("namespace", "default"), service_account_name(pod_template(resource)[1]))
+                    token_workloads[account] = token_workloads.get(account, 0) + 1
+                    continue
+                counts = findings.setdefault(defense_id, [0, 0])
+                counts[0] += compliant
+                counts[1] += 1
+    return resources, findings, service_accounts, token_workloads
+
+# 8.3 of the workloads without a pod level setting: compliant when their ServiceAccount disables the token
+def resolve_token_workloads(findings, service_accounts, token_workloads):
+    for account, count in token_workloads.items():
+        counts = findings.setdefault("8.3", [0, 0])
+        counts[0] += count if service_accounts.get(account) is False else 0
+        counts[1] += count
+    return findings
+
+# Resource count and [compliant, total] per measure of parsed documents
+def detect_inventory(documents):
+    resources, findings, service_accounts, token_workloads = inspect_documents(documents)
+    return resources, resolve_token_workloads(findings, service_accounts, token_workloads)
+
+# Parse and inspect a batch of yaml documents in a worker process
+def detect_yaml_batch(texts):
+    return inspect_documents(yaml.load_all("\n---\n".join(texts), Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+
+def open_inventory(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    f = gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, "r", encoding="utf-8")
+    if name.endswith((".yaml", ".yml")):
+        return f, "yaml"
+    if name.endswith(".json"):
+        return f, "json"
+    # Unknown extension, json dumps start with an object or an array
+    head = f.read(4096)
+    f.seek(0)
+    return f, "json" if head.lstrip()[:1] in ("{", "[") else "yaml"
+
+# Stream a dump resource by resource. Json is decoded by the C decoder as fast as it is read, so it is inspected
+# in this process; yaml parsing dominates, documents go in batches through a process pool (a bounded number in flight)
+def scan_inventory(path, jobs):
+    f, file_format = open_inventory(path)
+    if file_format == "yaml" and yaml is None:
+        f.close()
+        raise ValueError("reading yaml dumps requires PyYAML (pip install pyyaml)")
+
+    with f, Worker.profiler.stage("inventory:{}".format(file_format)):
+        if file_format == "json":
+            resources, findings = detect_inventory(stream_json_resources(f, inventory_batch_size))
+            Worker.profiler.count("inventory_resources", resources)
+            return resources, findings
+
+        def batches():
+            texts, size = [], 0
+            for text in stream_yaml_documents(f):
+                texts.append(text)
+                size += len(text)
+                if size >= inventory_batch_size:
+                    yield texts
+                    texts, size = [], 0
+            if texts:
+                yield texts
+
+        total = 0
+        findings = {}
+        service_accounts = {}
+        token_workloads = {}
+        def merge(result):
+            nonlocal total
+            resources, batch_findings, batch_service_accounts, batch_token_workloads = result
+            total += resources
+            for defense_id, (compliant, count) in batch_findings.items():
+                counts = findings.setdefault(defense_id, [0, 0])
+                counts[0] += compliant
+                counts[1] += count
+            service_accounts.update(batch_service_accounts)
+            for account, count in batch_token_workloads.items():
+                token_workloads[account] = token_workloads.get(account, 0) + count
+
+        if jobs == 1:
+            for batch in batches():
+                merge(detect_yaml_batch(batch))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                pending = deque()
+                for batch in batches():
+                    pending.append(executor.submit(detect_yaml_batch, batch))
+                    if len(pending) >= jobs * 2:
+                        merge(pending.popleft().result())
+                while pending:
+                    merge(pending.popleft().result())
+        Worker.profiler.count("inventory_resources", total)
+        return total, resolve_token_workloads(findings, service_accounts, token_workloads)
+
+# Detect the deployed defense measures of each dump and evaluate them like coverage profiles
+def run_inventory(paths, jobs, min_ratio, worker, k8s_versions, profiles_file):
+    profiles = {}
+    for path in paths:
+        start = time.perf_counter()
+        resources, findings = scan_inventory(path, jobs)
+        elapsed = time.perf_counter() - start
+
+        print("[*] Scanned {} resources from {} in {:.1f} ms with {} process(es)".format(resources, path, elapsed * 1000, jobs), file=sys.stderr)
+        print("{:<10}{:>12}  {:<10}{}".format("Defense", "Compliant", "Status", "Name"), file=sys.stderr)
+        deployed = []
+        for defense_id in sorted(findings, key=lambda defense_id: [int(part) for part in defense_id.split(".")]):
+            if defense_id not in worker.defense_index:
+                continue
+            compliant, count = findings[defense_id]
+            in_place = compliant / count >= min_ratio
+            if in_place:
+                deployed.append(defense_id)
+            print("{:<10}{:>12}  {:<10}{}".format(defense_id, "{}/{}".format(compliant, count), "deployed" if in_place else "partial",
+                                                 worker.defense_index[defense_id].name), file=sys.stderr)
+
+        name = os.path.basename(path)
+        while name in profiles:
+            name += "'"
+        profiles[name] = deployed
+
+    if profiles_file:
+        with open(profiles_file, "w") as f:
+            json.dump(profiles, f, indent=4)
+        print("[*] Profiles written to {}".format(profiles_file), file=sys.stderr)
+
+    worker.get_coverage(profiles, k8s_versions)
+
+# Local analyzer service: keeps the knowledge base resident and caches rendered responses (LRU). Reloads and
+# renders run in the default executor so that the event loop keeps accepting connections meanwhile
+class AnalyzerService:
+    reload_check_interval = 1.0
+    content_types = {"json": "application/json", "txt": "text/plain; charset=utf-8", "html": "text/html; charset=utf-8"}
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+    def __init__(self, cache_size):
+        if Worker.kb is None:
+            Worker.load_data_from_file()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.last_reload_check = time.monotonic()
+        self.template_path = "{}/{}".format(Worker.asset_directory, Worker.html_template)
+        self.template_mtime, self.template_digest = self.template_fingerprint()
+
+    def template_fingerprint(self):
+        try:
+            with open(self.template_path, "rb") as f:
+                return os.fstat(f.fileno()).st_mtime_ns, hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None, ""
+
+    # Hot reload: cheap stat of the sources at most once per interval, rebuild when their content changed. One
+    # request thread checks and reloads at a time, the others wait for the new knowledge base
+    def reload_if_changed(self):
+        with self.reload_lock:
+            now = time.monotonic()
+            if now - self.last_reload_check < self.reload_check_interval:
+                return
+            self.last_reload_check = now
+
+            if KnowledgeBase.check_sources(Worker.kb.sources) != Worker.kb.sources:
+                digest = Worker.kb.digest
+                Worker.load_data_from_file()
+                if Worker.kb.digest != digest:
+                    with self.cache_lock:
+                        self.cache.clear()
+                    print("[*] Knowledge base reloaded ({})".format(Worker.kb.digest[:12]))
+
+            try:
+                template_mtime = os.stat(self.template_path).st_mtime_ns
+            except OSError:
+                template_mtime = None
+            if template_mtime != self.template_mtime:
+                digest = self.template_digest
+                self.template_mtime, self.template_digest = self.template_fingerprint()
+                if self.template_digest != digest:
+                    with self.cache_lock:
+                        self.cache.clear()
+                    print("[*] Html template reloaded")
+
+    # Answer a query: returns status, content type and body
+    def respond(self, path, query):
+        params = parse_qs(query)
+
+        def param(name, default):
+            return params.get(name, [default])[-1]
+
+        # Knowledge base of this request, a reload in another thread swaps Worker.kb meanwhile
+        kb = Worker.kb
+        if path == "/health":
+            body = {"status": "ok", "knowledge_base": kb.digest, "cache": {"entries": len(self.cache), "hits": self.hits, "misses": self.misses}}
+            return 200, "json", json.dumps(body)
+
+        if path not in ("/analyzer", "/template"):
+            return 404, "json", json.dumps({"error": "unknown path {}".format(path)})
+
+        tactics = [tactic for tactic in param("tactics", "All").split(",") if tactic]
+        output_format = param("format", "json")
+        scenario = param("scenario", "")
+        k8s_version = param("version", "")
+        compact = param("compact", "false") in ("1", "true")
+
+        if not tactics or any(tactic not in tactics_list_of_choices for tactic in tactics):
+            return 400, "json", json.dumps({"error": "tactics must be a comma separated list of {}".format(", ".join(tactics_list_of_choices))})
+        if path == "/analyzer":
+            scenario_count = len(kb.impact_measures["Scenarios"])
+            if output_format not in ("json", "txt", "html"):
+                return 400, "json", json.dumps({"error": "format must be one of json, txt, html"})
+            if not scenario.isdigit() or not 1 <= int(scenario) <= scenario_count:
+                return 400, "json", json.dumps({"error": "scenario must be a number between 1 and {}".format(scenario_count)})
+            if k8s_version not in k8s_version_list_of_choices:
+                return 400, "json", json.dumps({"error": "version must be one of {}".format(", ".join(k8s_version_list_of_choices))})
+        elif output_format not in ("json", "html"):
+            return 400, "json", json.dumps({"error": "format must be one of json, html"})
+
+        key = (kb.digest, self.template_digest, path, scenario, tuple(tactics), k8s_version, output_format, compact)
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return 200, output_format, self.cache[key]
+            self.misses += 1
+
+        worker = Worker(path[1:], tactics, output_format)
+        worker.kb, worker.defense_measures, worker.impact_measures, worker.defense_index = kb, kb.defense_measures, kb.impact_measures, kb.defense_index
+        worker.compact = compact
+        if path == "/analyzer":
+            worker.select_scenario_data(int(scenario) - 1)
+            report = worker.build_report(k8s_version)
+            if output_format == "json":
+                body = worker.render_json(report)
+            elif output_format == "txt":
+                body = "".join(worker.render_txt(report))
+            else:
+                body = "".join(worker.render_html(report, "analyzer"))
+        else:
+            worker.collect_templates()
+            if output_format == "json":
+                body = json.dumps(worker.templates, indent=4)
+            else:
+                body = "".join(worker.render_html(None, "template"))
+
+        with self.cache_lock:
+            self.cache[key] = body
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return 200, output_format, body
+
+    # Minimal HTTP/1.1 handling: one GET request per connection
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+
+            try:
+                method, target, _ = request_line.split(" ", 2)
+            except ValueError:
+                status, output_format, body = 400, "json", json.dumps({"error": "malformed request"})
+            else:
+                if method != "GET":
+                    status, output_format, body = 405, "json", json.dumps({"error": "only GET is supported"})
+                else:
+                    url = urlsplit(target)
+                    loop = asyncio.get_running_loop()
+                    try:
+                        await loop.run_in_executor(None, self.reload_if_changed)
+                        status, output_format, body = await loop.run_in_executor(None, self.respond, url.path, url.query)
+                    except Exception as e:
+                        status, output_format, body = 500, "json", json.dumps({"error": str(e)})
+
+            payload = body.encode()
+            writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+                status, self.reasons[status], self.content_types[output_format], len(payload)).encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, socket_path):
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+            print("[*] Serving on unix socket {}".format(socket_path))
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print("[*] Serving on http://{}:{}".format(host, port))
+        async with server:
+            await server.serve_forever()
+
 # Override of ArgumentParser for custom error messages
 class CustomParser(ArgumentParser):
     def error(self, message):
@@ -433,16 +2749,62 @@ class CustomFormatter(HelpFormatter):
             return text[2:].splitlines()  
         return HelpFormatter._split_lines(self, text, width)
 
-def main():
-    tactics_list_of_choices = ["All", "Reconnaissance", "InitialAccess", "Execution", "Discovery", "LateralMovement", "PrivilegeEscalation", "Collection", "DefenseEvasion"]
-    output_list_of_choices = ["stdout", "json", "txt", "html"]
-    k8s_version_list_of_choices = ["1.18", "1.19", "1.20", "1.21"]
+# Scenario numbers (or All) from the command line as scenario indexes
+def parse_scenarios(parser, scenario_args):
+    scenario_count = len(Worker.impact_measures["Scenarios"])
+    if "All" in scenario_args:
+        return list(range(scenario_count))
+    if not all(scenario.isdigit() and 1 <= int(scenario) <= scenario_count for scenario in scenario_args):
+        parser.error("scenarios must be All or numbers between 1 and {}".format(scenario_count))
+    return sorted(set(int(scenario) - 1 for scenario in scenario_args))
+
+# Kubernetes versions (or All) from the command line in version order. Modes running worker processes also
+# get their job count checked
+def parse_versions_and_jobs(parser, args):
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("jobs must be at least 1")
+    if "All" in args.versions:
+        return k8s_version_list_of_choices
+    return sorted(set(args.versions), key=k8s_version_list_of_choices.index)
+
+def parse_tactic_sets(parser, tactic_set_args):
+    tactic_sets = []
+    for tactic_set in tactic_set_args:
+        tactics = [tactic for tactic in tactic_set.split(",") if tactic]
+        if not tactics or any(tactic not in tactics_list_of_choices for tactic in tactics):
+            parser.error("invalid tactic set {} (choose from {})".format(tactic_set, ", ".join(tactics_list_of_choices)))
+        tactic_sets.append(tactics)
+    return tactic_sets
 
+def main():
     parser = CustomParser(description="Script for perfroming Kubernetes defense impact analysis", formatter_class=CustomFormatter, usage=SUPPRESS)
     
     subparser = parser.add_subparsers(help="sub-command help", dest="mode")
 
-    parser_analyzer = subparser.add_parser("analyzer", help="analyzer help")
+    profiling_parser = ArgumentParser(add_help=False)
+    profiling_parser.add_argument("--profile", help="Print wall time, call counts and peak memory per stage", action="store_true")
+    profiling_parser.add_argument("--metrics-file", help="Write the per stage metrics to this file")
+    profiling_parser.add_argument("--metrics-format", help="Metrics file format", default="json", choices=["json", "prometheus"])
+
+    # Options shared by several modes
+    pager_parser = ArgumentParser(add_help=False)
+    pager_parser.add_argument("--no-pager", help="Write long reports straight to the terminal instead of through $PAGER", action="store_true")
+    cache_parser = ArgumentParser(add_help=False)
+    cache_parser.add_argument("--no-cache", help="Always regenerate reports instead of reusing identical ones", action="store_true")
+    compact_parser = ArgumentParser(add_help=False)
+    compact_parser.add_argument("--compact", help="R|Json reports list the version status entries once\nand reference them by index", action="store_true")
+    versions_parser = ArgumentParser(add_help=False)
+    versions_parser.add_argument("-v", "--versions", help="Kubernetes Versions or All", default=["All"], nargs="+", choices=["All"] + k8s_version_list_of_choices)
+    jobs_parser = ArgumentParser(add_help=False)
+    jobs_parser.add_argument("-j", "--jobs", help="Number of worker processes", type=int, default=os.cpu_count() or 1)
+
+    # Scenario x version x tactic set matrix of batch and watch
+    matrix_parser = ArgumentParser(add_help=False, parents=[versions_parser, jobs_parser, cache_parser, compact_parser])
+    matrix_parser.add_argument("-s", "--scenarios", help="Attack path scenarios (numbers) or All", default=["All"], nargs="+")
+    matrix_parser.add_argument("-t", "--tactic-sets", help="R|Tactic sets, each a comma separated list of\nMitre ATT&CK Tactics (e.g. All Execution,Discovery)", default=["All"], nargs="+")
+    matrix_parser.add_argument("-o", "--output", help="Output methods", default=["json"], choices=["json", "txt", "html", "html-site"], nargs="+")
+
+    parser_analyzer = subparser.add_parser("analyzer", help="analyzer help", parents=[profiling_parser, pager_parser, cache_parser, compact_parser])
     parser_analyzer.add_argument("-s", "--scenario", help="R|Select attack path scenario:\n" 
                                                 "1: Exploitation of RCE in application\n"
                                                 "2: Supply chain attack\n"
@@ -450,27 +2812,190 @@ def main():
     parser_analyzer.add_argument("-t", "--tactics", type=str, help="List of Mitre ATT&CK Tactics\n", required=True, 
                                             choices=tactics_list_of_choices, nargs="+")
     parser_analyzer.add_argument("-v", "--version", help="R|Kubernetes Version", default="1.20", required=True, choices=k8s_version_list_of_choices)
-    parser_analyzer.add_argument("-o", "--output", help="Output method", default="stdout", choices=output_list_of_choices)
+    parser_analyzer.add_argument("-o", "--output", help="Output methods", default=["stdout"], choices=output_list_of_choices + ["html-site"], nargs="+")
     
-    parser_template = subparser.add_parser("template", help="template help")
+    parser_template = subparser.add_parser("template", help="template help", parents=[profiling_parser, cache_parser])
     parser_template.add_argument("-t", "--tactics", type=str, help="List of Mitre ATT&CK Tactics\n", required=True, 
                                             choices=tactics_list_of_choices, nargs="+")
-    parser_template.add_argument("-o", "--output", help="Output method", default="stdout", choices=output_list_of_choices)
+    parser_template.add_argument("-o", "--output", help="Output methods", default=["stdout"], choices=output_list_of_choices, nargs="+")
+
+    parser_batch = subparser.add_parser("batch", help="analyze a matrix of scenarios, versions and tactic sets in one process", parents=[profiling_parser, matrix_parser])
+
+    parser_watch = subparser.add_parser("watch", help="keep batch reports up to date, re-rendering only the reports a knowledge base or template edit affects",
+                                        parents=[matrix_parser])
+    parser_watch.add_argument("-i", "--interval", help="Seconds between checks for changes", type=float, default=1.0)
+
+    parser_cache = subparser.add_parser("cache", help="show report cache statistics")
+    parser_cache.add_argument("--clear", help="Remove every cached report", action="store_true")
+    parser_cache.add_argument("--prune", help="Remove cached reports older than --max-age, then the least recently used ones until the cache fits in --max-size", action="store_true")
+    parser_cache.add_argument("--max-age", help="Maximum age of a cached report in days (with --prune)", type=float, default=ReportCache.max_age / (24 * 3600))
+    parser_cache.add_argument("--max-size", help="Maximum total size of the cached reports in MiB (with --prune)", type=float, default=ReportCache.max_size / (1024 * 1024))
+
+    parser_serve = subparser.add_parser("serve", help="serve analyzer and template queries from a local HTTP server or Unix socket")
+    parser_serve.add_argument("--host", help="Loopback address to listen on", default="127.0.0.1", choices=["127.0.0.1", "::1", "localhost"])
+    parser_serve.add_argument("-p", "--port", help="Port to listen on", type=int, default=8080)
+    parser_serve.add_argument("--socket", help="Listen on this Unix socket path instead of TCP")
+    parser_serve.add_argument("--cache-size", help="Number of rendered responses kept in memory", type=int, default=256)
+
+    parser_coverage = subparser.add_parser("coverage", help="evaluate deployed defense measures against every scenario and technique (covered: every listed "
+                                           "measure deployed, partially covered: some)", parents=[profiling_parser, versions_parser, pager_parser])
+    parser_coverage_profiles = parser_coverage.add_mutually_exclusive_group(required=True)
+    parser_coverage_profiles.add_argument("-d", "--defenses", help="Deployed defense measure ids (e.g. 5.1.1 8.3)", nargs="+")
+    parser_coverage_profiles.add_argument("-p", "--profiles", help="R|Json file mapping cluster profile names\nto lists of deployed defense measure ids")
+    parser_coverage.add_argument("-t", "--tactics", type=str, help="List of Mitre ATT&CK Tactics\n", default=["All"],
+                                            choices=tactics_list_of_choices, nargs="+")
+    parser_coverage.add_argument("-o", "--output", help="Output method", default="stdout", choices=["stdout", "json"])
+
+    parser_inventory = subparser.add_parser("inventory", help="detect deployed defense measures from kubectl json/yaml dumps and evaluate their coverage",
+                                             parents=[profiling_parser, versions_parser, jobs_parser, pager_parser])
+    parser_inventory.add_argument("-f", "--files", help="R|Cluster dumps (kubectl get -A -o json or multi-document\nyaml, optionally gzipped), one coverage profile each", required=True, nargs="+")
+    parser_inventory.add_argument("--min-ratio", help="R|Share of workloads/roles that must comply for a\nper resource measure to count as deployed", type=float, default=1.0)
+    parser_inventory.add_argument("--save-profiles", help="Write the detected profiles as json (for coverage -p)")
+    parser_inventory.add_argument("-t", "--tactics", type=str, help="List of Mitre ATT&CK Tactics\n", default=["All"],
+                                            choices=tactics_list_of_choices, nargs="+")
+    parser_inventory.add_argument("-o", "--output", help="Output method", default="stdout", choices=["stdout", "json"])
+
+    parser_diff = subparser.add_parser("diff", help="show the defense measures and techniques whose protection changes between two Kubernetes versions",
+                                        parents=[profiling_parser, pager_parser, cache_parser])
+    parser_diff.add_argument("--from", dest="from_version", help="R|Kubernetes Version upgraded from", required=True, choices=k8s_version_list_of_choices)
+    parser_diff.add_argument("--to", dest="to_version", help="R|Kubernetes Version upgraded to", required=True, choices=k8s_version_list_of_choices)
+    parser_diff.add_argument("-s", "--scenarios", help="Attack path scenarios (numbers) or All", default=["All"], nargs="+")
+    parser_diff.add_argument("-t", "--tactics", type=str, help="List of Mitre ATT&CK Tactics\n", default=["All"],
+                                            choices=tactics_list_of_choices, nargs="+")
+    parser_diff.add_argument("-o", "--output", help="Output methods", default=["stdout"], choices=output_list_of_choices, nargs="+")
+
+    parser_optimize = subparser.add_parser("optimize", help="compute the cheapest set of defense measures mitigating the selected techniques (at least one "
+                                           "listed measure in effect each, covered or partially covered in coverage mode)", parents=[profiling_parser, pager_parser])
+    parser_optimize.add_argument("-s", "--scenarios", help="Attack path scenarios (numbers) or All", default=["All"], nargs="+")
+    parser_optimize.add_argument("-t", "--tactics", type=str, help="List of Mitre ATT&CK Tactics\n", default=["All"],
+                                            choices=tactics_list_of_choices, nargs="+")
+    parser_optimize.add_argument("-v", "--version", help="R|Kubernetes Version", required=True, choices=k8s_version_list_of_choices)
+    parser_optimize.add_argument("-c", "--costs", help="Json file mapping defense measure ids to costs (default 1)")
+    parser_optimize.add_argument("--exact-limit", help="Use exact search up to this many candidate measures", type=int, default=24)
+    parser_optimize.add_argument("-o", "--output", help="Output method", default="stdout", choices=["stdout", "json"])
+
+    subparser.add_parser("compile", help="compile the knowledge base json files for fast startup", parents=[profiling_parser])
 
     args = parser.parse_args()
+    if isinstance(getattr(args, "output", None), list):
+        args.output = list(dict.fromkeys(args.output))
+
+    # Memory tracing is only switched on for the --profile table, metrics files alone stay cheap
+    profile = getattr(args, "profile", False)
+    metrics_file = getattr(args, "metrics_file", None)
+    if profile or metrics_file:
+        Worker.profiler = Profiler(enabled=True, track_memory=profile)
 
     # Arguments
     if args.mode == "analyzer":
         scenario = int(args.scenario) - 1
         worker = Worker(args.mode, args.tactics, args.output)
+        worker.use_cache = not args.no_cache
+        worker.compact = args.compact
+        worker.pager = not args.no_pager
         worker.get_scenario_data(scenario, args.version)
     elif args.mode == "template":
         worker = Worker(args.mode, args.tactics, args.output)
+        worker.use_cache = not args.no_cache
         templates = worker.get_only_templates()
+    elif args.mode == "batch":
+        Worker.load_data_from_file()
+        scenarios = parse_scenarios(parser, args.scenarios)
+        k8s_versions = parse_versions_and_jobs(parser, args)
+        tactic_sets = parse_tactic_sets(parser, args.tactic_sets)
+        run_batch(scenarios, k8s_versions, tactic_sets, args.output, args.jobs, not args.no_cache, args.compact)
+    elif args.mode == "watch":
+        Worker.load_data_from_file()
+        scenarios = parse_scenarios(parser, args.scenarios)
+        k8s_versions = parse_versions_and_jobs(parser, args)
+        tactic_sets = parse_tactic_sets(parser, args.tactic_sets)
+        if args.interval <= 0:
+            parser.error("interval must be positive")
+        try:
+            watch(scenarios, "All" in args.scenarios, k8s_versions, tactic_sets, args.output, args.jobs, not args.no_cache, args.compact, args.interval)
+        except KeyboardInterrupt:
+            print("[*] Stopped")
+    elif args.mode == "coverage":
+        worker = Worker(args.mode, args.tactics, args.output)
+        if args.profiles:
+            try:
+                with open(args.profiles, "r") as f:
+                    profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                parser.error("could not read profiles file {}: {}".format(args.profiles, e))
+            if not isinstance(profiles, dict) or not all(isinstance(defense_ids, list) for defense_ids in profiles.values()):
+                parser.error("profiles file must map profile names to lists of defense measure ids")
+        else:
+            profiles = {"deployed": args.defenses}
+
+        unknown_ids = sorted({defense_id for defense_ids in profiles.values() for defense_id in defense_ids if defense_id not in worker.defense_index})
+        if unknown_ids:
+            parser.error("unknown defense measure ids: {}".format(", ".join(unknown_ids)))
+
+        k8s_versions = parse_versions_and_jobs(parser, args)
+        worker.pager = not args.no_pager
+        worker.get_coverage(profiles, k8s_versions)
+    elif args.mode == "inventory":
+        k8s_versions = parse_versions_and_jobs(parser, args)
+        if not 0 < args.min_ratio <= 1:
+            parser.error("min ratio must be in (0, 1]")
+        worker = Worker("coverage", args.tactics, args.output)
+        worker.pager = not args.no_pager
+        try:
+            run_inventory(args.files, args.jobs, args.min_ratio, worker, k8s_versions, args.save_profiles)
+        except (OSError,) + inventory_parse_errors as e:
+            print("[!][!] Could not read inventory: {}".format(e))
+            sys.exit(2)
+    elif args.mode == "diff":
+        worker = Worker(args.mode, args.tactics, args.output)
+        worker.use_cache = not args.no_cache
+        worker.pager = not args.no_pager
+        worker.get_version_diff(parse_scenarios(parser, args.scenarios), args.from_version, args.to_version)
+    elif args.mode == "optimize":
+        worker = Worker(args.mode, args.tactics, args.output)
+        scenarios = parse_scenarios(parser, args.scenarios)
+        costs = {}
+        if args.costs:
+            try:
+                with open(args.costs, "r") as f:
+                    costs = json.load(f)
+            except (OSError, ValueError) as e:
+                parser.error("could not read costs file {}: {}".format(args.costs, e))
+            if not isinstance(costs, dict) or not all(isinstance(cost, (int, float)) and cost > 0 for cost in costs.values()):
+                parser.error("costs file must map defense measure ids to positive numbers")
+        worker.pager = not args.no_pager
+        worker.get_optimized_defenses(scenarios, args.version, costs, args.exact_limit)
+    elif args.mode == "serve":
+        if args.cache_size < 1:
+            parser.error("cache size must be at least 1")
+        service = AnalyzerService(args.cache_size)
+        try:
+            asyncio.run(service.serve(args.host, args.port, args.socket))
+        except KeyboardInterrupt:
+            print("[*] Stopped")
+    elif args.mode == "cache":
+        cache = ReportCache(Worker.output_directory)
+        if not os.path.exists(Worker.output_directory):
+            os.makedirs(Worker.output_directory)
+        if args.clear:
+            cache.clear()
+        elif args.prune:
+            if args.max_age < 0 or args.max_size < 0:
+                parser.error("max age and max size must not be negative")
+            cache.max_age = args.max_age * 24 * 3600
+            cache.max_size = args.max_size * 1024 * 1024
+            cache.prune()
+        cache.print_stats()
+    elif args.mode == "compile":
+        Worker.compile_knowledge_base()
     else:
         parser.print_help()
         sys.exit(2) 
-    
+
+    if profile:
+        Worker.profiler.print_table()
+    if metrics_file:
+        Worker.profiler.write_metrics(metrics_file, args.metrics_format)
     
 
 if __name__ == "__main__":
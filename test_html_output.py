@@ -0,0 +1,70 @@
+import os
+import re
+
+import pytest
+
+from impact_analyzer import HtmlTemplate, Worker
+
+here = os.path.dirname(os.path.abspath(__file__))
+golden_directory = os.path.join(here, "test_data", "golden")
+timestamp = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}")
+
+# Golden files: html reports of the BeautifulSoup implementation, timestamps replaced by TIMESTAMP
+analyzer_cases = [
+    ("analyzer-S1-v1.21-All.html", 0, ["All"], "1.21"),
+    ("analyzer-S2-v1.18-Execution+PrivilegeEscalation.html", 1, ["Execution", "PrivilegeEscalation"], "1.18"),
+    ("analyzer-S3-v1.20-All.html", 2, ["All"], "1.20"),
+]
+template_cases = [
+    ("template-All.html", ["All"]),
+    ("template-Discovery+LateralMovement.html", ["Discovery", "LateralMovement"]),
+]
+
+@pytest.fixture
+def output_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(Worker, "defense_measures_path", os.path.join(here, "defense_measures.json"))
+    monkeypatch.setattr(Worker, "scenario_impact_analysis_path", os.path.join(here, "scenario_impact_analysis.json"))
+    monkeypatch.setattr(Worker, "compiled_kb_path", str(tmp_path / "knowledge_base.compiled"))
+    monkeypatch.setattr(Worker, "output_directory", str(tmp_path / "output"))
+    monkeypatch.setattr(Worker, "asset_directory", os.path.join(here, "assets"))
+    for name in ("kb", "defense_measures", "impact_measures", "defense_index"):
+        monkeypatch.setattr(Worker, name, None, raising=False)
+    return tmp_path / "output"
+
+def read_report(output_directory):
+    with open(os.path.join(output_directory, "report.html"), "r") as f:
+        return timestamp.sub("TIMESTAMP", f.read())
+
+def read_golden(name):
+    with open(os.path.join(golden_directory, name), "r") as f:
+        return f.read()
+
+def make_worker(mode, tactics):
+    worker = Worker(mode, tactics, ["html"])
+    worker.use_cache = False
+    worker.output_filename = "report"
+    return worker
+
+@pytest.mark.parametrize("golden, scenario, tactics, k8s_version", analyzer_cases)
+def test_analyzer_html_matches_golden(output_directory, golden, scenario, tactics, k8s_version):
+    make_worker("analyzer", tactics).get_scenario_data(scenario, k8s_version)
+    assert read_report(output_directory) == read_golden(golden)
+
+@pytest.mark.parametrize("golden, tactics", template_cases)
+def test_template_html_matches_golden(output_directory, golden, tactics):
+    make_worker("template", tactics).get_only_templates()
+    assert read_report(output_directory) == read_golden(golden)
+
+def test_template_void_elements_match_beautifulsoup(tmp_path):
+    bs4 = pytest.importorskip("bs4")
+    path = tmp_path / "template.html"
+    path.write_text(
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<link rel=\"stylesheet\" href=\"a.css\">\n"
+        "<title>Template</title>\n<style>\np { color: red; }\n</style>\n</head>\n"
+        "<body>\n<p>a<br>b<br/>c</p>\n<img src=\"a.png\" alt=\"x\">\n<hr>\n<input type=\"text\" disabled>\n</body>\n</html>\n")
+
+    template = HtmlTemplate(str(path), "Output X")
+    with open(str(path), "r") as f:
+        soup = bs4.BeautifulSoup(f, "html.parser")
+    soup.head.title.string = "Output X"
+    assert template.head + template.tail == soup.prettify()
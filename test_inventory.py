@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+import os
+
+import pytest
+
+import impact_analyzer
+from impact_analyzer import detect_defenses, detect_inventory, scan_inventory, stream_json_resources, stream_yaml_documents
+
+here = os.path.dirname(os.path.abspath(__file__))
+fixture_directory = os.path.join(here, "test_data", "inventory")
+
+# [compliant, total] per measure of the fixture dumps (test_data/inventory/cluster.json and cluster.yaml)
+expected_resources = 14
+expected_findings = {
+    "2.3": [1, 1],
+    "3.1": [3, 4],
+    "3.2.1": [1, 1],
+    "3.2.2": [1, 1],
+    "4.1.1": [1, 1],
+    "4.1.2": [1, 1],
+    "4.1.3": [1, 1],
+    "4.1.4": [1, 1],
+    "4.1.5": [1, 1],
+    "5.1.1": [1, 1],
+    "5.1.2": [1, 1],
+    "6.1.1": [1, 1],
+    "6.1.3": [1, 1],
+    "6.1.4": [1, 1],
+    "6.1.5": [1, 1],
+    "6.2": [3, 4],
+    "6.3": [2, 4],
+    "6.4": [1, 1],
+    "6.5": [3, 4],
+    "7.1": [2, 4],
+    "7.3": [1, 2],
+    "8.1": [1, 2],
+    "8.2": [1, 2],
+    "8.3": [3, 4],
+    "8.4": [2, 4],
+}
+
+def fixture_path(name):
+    return os.path.join(fixture_directory, name)
+
+def fixture_items():
+    with open(fixture_path("cluster.json"), "r", encoding="utf-8") as f:
+        return json.load(f)["items"]
+
+def stream(text, chunk_size):
+    return list(stream_json_resources(io.StringIO(text), chunk_size))
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 1 << 20])
+def test_json_list_bare_array_and_concatenated_objects(chunk_size):
+    items = fixture_items()
+    with open(fixture_path("cluster.json"), "r", encoding="utf-8") as f:
+        assert stream(f.read(), chunk_size) == items
+    assert stream(json.dumps(items), chunk_size) == items
+    assert stream("\n".join(json.dumps(item, indent=2) for item in items), chunk_size) == items
+    assert stream("".join(json.dumps(item) for item in items), chunk_size) == items
+
+# Every split point of values cut at the buffer edge: numbers (1.5e|3 decodes short), strings with escapes,
+# literals and nested containers
+def test_json_values_split_at_every_offset():
+    items = [{"a": 1.5e3, "b": -12.25, "c": 100, "d": 2e-7}, {"s": "quote \" backslash \\ unicode é –", "t": True, "n": None},
+             {"nested": {"list": [1, [2, [3.5]], {"k": "}]"}]}}, [], 7, 1.5e3, -2.5e-12, "bare"]
+    text = json.dumps({"kind": "List", "items": items, "metadata": {"resourceVersion": "12"}})
+    for chunk_size in range(1, 12):
+        assert stream(text, chunk_size) == items
+
+def test_json_list_keys_after_items_are_not_resources():
+    text = '{"apiVersion": "v1", "items": [{"kind": "Pod"}], "kind": "List", "metadata": {"resourceVersion": ""}}'
+    assert stream(text, 4) == [{"kind": "Pod"}]
+
+def test_json_object_without_items_is_one_resource():
+    assert stream('{"kind": "Namespace", "metadata": {"name": "prod"}}', 3) == [{"kind": "Namespace", "metadata": {"name": "prod"}}]
+
+@pytest.mark.parametrize("text", ['{"items": [{"kind": "Pod"}', '[{"kind": "Pod"}, {"kind": ', '{"kind" "Pod"}', '[1.5e]'])
+def test_json_truncated_or_invalid_dump_raises(text):
+    with pytest.raises(ValueError):
+        stream(text, 3)
+
+def test_yaml_documents_are_split_on_markers():
+    text = "# comment\n---\na: 1\n--- b: 2\n...\n---\nc: [3]\n"
+    assert list(stream_yaml_documents(io.StringIO(text))) == ["# comment\n", "a: 1\n", "b: 2\n", "c: [3]\n"]
+
+def test_detect_inventory_counts_compliant_resources():
+    resources, findings = detect_inventory([{"kind": "List", "items": fixture_items()}])
+    assert resources == expected_resources
+    assert findings == expected_findings
+
+def test_system_workloads_only_evidence_runtime_tools():
+    daemon_set = {"kind": "DaemonSet", "metadata": {"namespace": "kube-system"},
+                  "spec": {"template": {"spec": {"containers": [{"image": "falcosecurity/falco:0.36.2"}]}}}}
+    assert list(detect_defenses(daemon_set)) == [("6.4", True)]
+
+# 8.3: the pod level setting wins, otherwise the ServiceAccount of the same namespace decides, wherever it is in the dump
+def test_token_automount_falls_back_to_the_service_account():
+    def workload(namespace, account, automount=None):
+        spec = {"serviceAccountName": account, "containers": [{"image": "app"}]}
+        if automount is not None:
+            spec["automountServiceAccountToken"] = automount
+        return {"kind": "Pod", "metadata": {"namespace": namespace}, "spec": spec}
+
+    def service_account(namespace, name, automount):
+        return {"kind": "ServiceAccount", "metadata": {"namespace": namespace, "name": name}, "automountServiceAccountToken": automount}
+
+    resources = [workload("prod", "api"), workload("staging", "api"), workload("prod", "web", True), workload("prod", "jobs"),
+                 service_account("prod", "api", False), service_account("staging", "web", False), service_account("prod", "web", False)]
+    assert list(detect_defenses(resources[0]))[1] == ("8.3", None)
+    assert detect_inventory([{"kind": "List", "items": resources}])[1]["8.3"] == [1, 4]
+
+@pytest.mark.parametrize("batch_size", [3, 1 << 20])
+def test_scan_json_and_gzip_dumps(tmp_path, monkeypatch, batch_size):
+    monkeypatch.setattr(impact_analyzer, "inventory_batch_size", batch_size)
+    compressed = tmp_path / "cluster.json.gz"
+    with open(fixture_path("cluster.json"), "rb") as f, gzip.open(str(compressed), "wb") as gz:
+        gz.write(f.read())
+
+    assert scan_inventory(fixture_path("cluster.json"), 1) == (expected_resources, expected_findings)
+    assert scan_inventory(str(compressed), 1) == (expected_resources, expected_findings)
+
+@pytest.mark.parametrize("batch_size, jobs", [(3, 1), (1 << 20, 1), (3, 2)])
+def test_scan_yaml_dump(tmp_path, monkeypatch, batch_size, jobs):
+    pytest.importorskip("yaml")
+    monkeypatch.setattr(impact_analyzer, "inventory_batch_size", batch_size)
+    compressed = tmp_path / "cluster.yaml.gz"
+    with open(fixture_path("cluster.yaml"), "rb") as f, gzip.open(str(compressed), "wb") as gz:
+        gz.write(f.read())
+
+    assert scan_inventory(fixture_path("cluster.yaml"), jobs) == (expected_resources, expected_findings)
+    assert scan_inventory(str(compressed), jobs) == (expected_resources, expected_findings)
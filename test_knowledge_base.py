@@ -0,0 +1,54 @@
+import os
+import pickle
+
+import pytest
+
+from impact_analyzer import KnowledgeBase
+
+here = os.path.dirname(os.path.abspath(__file__))
+json_paths = (os.path.join(here, "defense_measures.json"), os.path.join(here, "scenario_impact_analysis.json"))
+
+@pytest.fixture
+def compiled_path(tmp_path):
+    path = str(tmp_path / "knowledge_base.compiled")
+    KnowledgeBase.load(*json_paths, path)
+    return path
+
+def record_base(compiled_path):
+    with open(compiled_path, "rb") as f:
+        pickle.load(f)
+        core = pickle.load(f)
+        return f.tell(), core
+
+def overwrite(compiled_path, offset, size):
+    with open(compiled_path, "r+b") as f:
+        f.seek(offset)
+        f.write(b"\xff" * size)
+
+def test_truncated_artifact_is_rebuilt_on_load(compiled_path):
+    expected = KnowledgeBase.from_json(*json_paths)
+    size = os.path.getsize(compiled_path)
+    os.truncate(compiled_path, size - 100)
+
+    kb = KnowledgeBase.load(*json_paths, compiled_path)
+    assert list(kb.impact_measures["Scenarios"]) == expected.impact_measures["Scenarios"]
+    assert os.path.getsize(compiled_path) == size
+
+@pytest.mark.parametrize("damaged", ["scenario", "category", "section"])
+def test_damaged_record_is_rebuilt_on_first_use(compiled_path, damaged, capsys):
+    expected = KnowledgeBase.from_json(*json_paths)
+    base, core = record_base(compiled_path)
+    start, end = {"scenario": core["scenario_offsets"][-1], "category": core["category_offsets"][0],
+                  "section": core["section_offsets"]["incidence"]}[damaged]
+    overwrite(compiled_path, base + start + 2, end - start - 4)
+
+    kb = KnowledgeBase.load(*json_paths, compiled_path)
+    assert list(kb.impact_measures["Scenarios"]) == expected.impact_measures["Scenarios"]
+    assert {defense_id: record.version_status_row for defense_id, record in kb.defense_index.items()} == \
+        {defense_id: record.version_status_row for defense_id, record in expected.defense_index.items()}
+    assert kb.technique_rows == expected.technique_rows
+    assert "is damaged, rebuilding it" in capsys.readouterr().err
+
+    rebuilt = KnowledgeBase.load(*json_paths, compiled_path)
+    assert list(rebuilt.impact_measures["Scenarios"]) == expected.impact_measures["Scenarios"]
+    assert rebuilt.technique_rows == expected.technique_rows
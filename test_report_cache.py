@@ -0,0 +1,72 @@
+import os
+
+from impact_analyzer import ReportCache
+
+def write(path, text):
+    with open(str(path), "w") as f:
+        f.write(text)
+
+def test_lookup_store_and_stats(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    report = tmp_path / "report.txt"
+    write(report, "report")
+
+    assert cache.lookup("a") is None
+    cache.store("a", str(report))
+    assert cache.lookup("a") == str(report)
+    assert cache.stats() == [1, 1]
+
+def test_missing_report_is_a_miss(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    report = tmp_path / "report.txt"
+    write(report, "report")
+    cache.store("a", str(report))
+    os.remove(str(report))
+
+    assert cache.lookup("a") is None
+    assert cache.entries() == {}
+
+def test_release_of_a_report_forgets_its_entry_and_links(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    report = tmp_path / "batch.txt"
+    link = tmp_path / "other.txt"
+    write(report, "report")
+    os.symlink("batch.txt", str(link))
+    cache.store("a", str(report))
+    cache.add_link("a", str(link))
+
+    cache.release(str(report))
+    assert cache.lookup("a") is None
+    assert report.exists()
+    assert not os.path.lexists(str(link))
+
+def test_release_of_a_link_keeps_the_entry(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    report = tmp_path / "report.txt"
+    link = tmp_path / "batch.txt"
+    write(report, "report")
+    os.symlink("report.txt", str(link))
+    cache.store("a", str(report))
+    cache.add_link("a", str(link))
+
+    cache.release(str(link))
+    cache.remove("a")
+    assert not report.exists()
+    assert os.path.lexists(str(link))
+
+def test_release_of_an_unknown_name_creates_nothing(tmp_path):
+    ReportCache(str(tmp_path)).release(str(tmp_path / "report.txt"))
+    assert os.listdir(str(tmp_path)) == []
+
+def test_prune_removes_least_recently_used_reports(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    for number, key in enumerate(("old", "new")):
+        report = tmp_path / "{}.txt".format(key)
+        write(report, "x" * 100)
+        cache.store(key, str(report))
+        os.utime(cache.entry_path(key), (number, number))
+
+    cache.max_size = 150
+    cache.prune()
+    assert list(cache.entries()) == ["new"]
+    assert not (tmp_path / "old.txt").exists()